@@ -0,0 +1,54 @@
+"""Benchmark convert_brackets_and_quotes on growing inputs to check it scales linearly.
+
+Usage: python benchmarks/bench_brackets.py [max_mb]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from convert_tsql_to_databricks import convert_brackets_and_quotes
+
+SAMPLE = """{{ config(materialized='table', alias='[x]') }}
+SELECT [PATIENT_ID] = P.[PATIENT_ID]
+    ,"Quoted Col" = P.[NAME]
+    ,note = 'a [literal] with "quotes"' -- [comment]
+FROM {{ ref('patients') }} P
+WHERE P.[NAME] LIKE '[A-Z]%'
+"""
+
+
+def make_input(size_bytes):
+    return SAMPLE * (size_bytes // len(SAMPLE) + 1)
+
+
+def time_call(sql, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        convert_brackets_and_quotes(sql)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    max_mb = float(sys.argv[1]) if len(sys.argv) > 1 else 10
+    sizes = [int(max_mb * 1024 * 1024 / 10 ** i) for i in range(3, -1, -1)]
+
+    print(f"{'size':>12} {'seconds':>10} {'MB/s':>8} {'us/KB':>8}")
+    per_kb = []
+    for size in sizes:
+        sql = make_input(size)
+        elapsed = time_call(sql)
+        mb = len(sql) / (1024 * 1024)
+        per_kb.append(elapsed * 1e6 / (len(sql) / 1024))
+        print(f"{len(sql):>12,} {elapsed:>10.4f} {mb / elapsed:>8.1f} {per_kb[-1]:>8.2f}")
+
+    # Linear scaling means cost per KB stays flat as the input grows
+    print(f"\nCost per KB, largest vs smallest input: {per_kb[-1] / per_kb[0]:.2f}x")
+
+
+if __name__ == '__main__':
+    main()
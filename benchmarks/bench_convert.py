@@ -0,0 +1,138 @@
+"""Time convert_tsql_to_databricks and every transform function on a synthetic corpus.
+
+Usage:
+    python benchmarks/bench_convert.py [--files N] [--size-kb N] [--mix ...] [--repeat N]
+    python benchmarks/bench_convert.py --save-baseline     # store results in benchmarks/baseline.json
+    python benchmarks/bench_convert.py --tolerance 0.25    # fail if anything is 25% slower than the baseline
+
+Transforms are timed on the in-memory corpus. The full conversion is timed
+file to file, so it includes disk I/O. Baseline comparisons are only
+meaningful on the machine that recorded the baseline.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARK_DIR))
+
+import convert_tsql_to_databricks as converter
+from corpus import generate_corpus, parse_mix, write_corpus
+
+DEFAULT_BASELINE = os.path.join(BENCHMARK_DIR, 'baseline.json')
+
+# Transforms that are not part of the pipeline but are still public
+STANDALONE_TRANSFORMS = [
+    'convert_concatenation',
+    'remove_nolock_hint',
+    'convert_isnull',
+    'convert_numeric',
+    'convert_dbt_vars',
+    'convert_brackets',
+    'fix_column_aliases',
+]
+
+
+def best_of(repeat, func):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def bench_full_conversion(corpus, repeat):
+    with tempfile.TemporaryDirectory() as temp_dir:
+        input_dir = os.path.join(temp_dir, 'input')
+        output_dir = os.path.join(temp_dir, 'output')
+        write_corpus(input_dir, corpus)
+        paths = []
+        for relative_path, _ in corpus:
+            output_path = os.path.join(output_dir, relative_path)
+            os.makedirs(os.path.dirname(output_path), exist_ok=True)
+            paths.append((os.path.join(input_dir, relative_path), output_path))
+
+        def run():
+            for input_path, output_path in paths:
+                converter.convert_tsql_to_databricks(input_path, output_path)
+        return best_of(repeat, run)
+
+
+def bench_transform(transform, texts, repeat):
+    def run():
+        for text in texts:
+            transform(text)
+    return best_of(repeat, run)
+
+
+def run_benchmarks(corpus, repeat):
+    """Return {name: seconds} for the full conversion and every transform"""
+    texts = [text for _, text in corpus]
+    results = {'convert_tsql_to_databricks': bench_full_conversion(corpus, repeat)}
+    transforms = list(converter.TRANSFORMS)
+    transforms += [getattr(converter, name) for name in STANDALONE_TRANSFORMS]
+    for transform in transforms:
+        results[transform.__name__] = bench_transform(transform, texts, repeat)
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Return the names that are more than tolerance slower than the baseline"""
+    return [name for name, seconds in results.items()
+            if name in baseline and seconds > baseline[name] * (1 + tolerance)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the TSQL to Databricks conversion")
+    parser.add_argument('--files', type=int, default=50)
+    parser.add_argument('--size-kb', type=float, default=20, help="average model size")
+    parser.add_argument('--mix', type=parse_mix, default=None,
+                        help="feature weights, e.g. convert=1,alias=2,brackets=1,case=1,plain=1,jinja=1")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--repeat', type=int, default=3, help="best of N runs per measurement")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help="allowed slowdown against the baseline before failing (default: 0.2 = 20%%)")
+    args = parser.parse_args()
+
+    corpus = generate_corpus(args.files, args.size_kb, args.mix, args.seed)
+    megabytes = sum(len(text) for _, text in corpus) / (1024 * 1024)
+    print(f"Corpus: {len(corpus)} files, {megabytes:.2f} MB, best of {args.repeat}\n")
+
+    results = run_benchmarks(corpus, args.repeat)
+
+    baseline = {}
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as f:
+            stored = json.load(f)
+        if stored.get('corpus') == [args.files, args.size_kb, args.seed, repr(args.mix)]:
+            baseline = stored['results']
+        else:
+            print("Baseline was recorded on a different corpus, not comparing\n")
+
+    print(f"{'name':34} {'seconds':>9} {'MB/s':>8} {'files/s':>9} {'vs base':>8}")
+    for name, seconds in results.items():
+        change = f"{seconds / baseline[name] - 1:+.0%}" if name in baseline else ''
+        print(f"{name:34} {seconds:>9.4f} {megabytes / seconds:>8.2f} {len(corpus) / seconds:>9.1f} {change:>8}")
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump({'corpus': [args.files, args.size_kb, args.seed, repr(args.mix)],
+                       'results': results}, f, indent=1)
+        print(f"\nBaseline saved to {args.baseline}")
+        return
+
+    slower = compare(results, baseline, args.tolerance)
+    if slower:
+        print(f"\nSlower than baseline by more than {args.tolerance:.0%}: {', '.join(slower)}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
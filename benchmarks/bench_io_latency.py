@@ -0,0 +1,78 @@
+"""Folder conversion throughput when every file read and write has network latency.
+
+Usage:
+    python benchmarks/bench_io_latency.py [--files N] [--size-kb N] [--latency-ms MS] [--io-threads N ...] [--jobs N]
+
+Converts a synthetic corpus with convert_folder_tsql_to_databricks_ansi.convert_files,
+adding MS of sleep to every read and write of the pipeline to stand in for a
+network mount. --io-threads 1 is close to the old one file at a time loop,
+larger values show how much of the latency the pipeline hides. The run with
+zero latency is the CPU bound target.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARK_DIR))
+
+import conversion_pipeline
+import convert_folder_tsql_to_databricks_ansi as folder
+from corpus import generate_corpus, write_corpus
+
+
+def with_latency(function, seconds):
+    def delayed(*args):
+        time.sleep(seconds)
+        return function(*args)
+    return delayed
+
+
+def run(tasks, jobs, io_threads):
+    start = time.perf_counter()
+    records = folder.convert_files(tasks, jobs=jobs, quiet=True, io_threads=io_threads)
+    elapsed = time.perf_counter() - start
+    failed = sum(record['status'] == 'error' for record in records)
+    return elapsed, failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark folder conversion under simulated I/O latency")
+    parser.add_argument('--files', type=int, default=200)
+    parser.add_argument('--size-kb', type=float, default=10, help="average model size")
+    parser.add_argument('--latency-ms', type=float, default=20, help="added to every read and write")
+    parser.add_argument('--io-threads', type=int, nargs='+', default=[1, 4, 16, 64])
+    parser.add_argument('--jobs', type=int, default=1)
+    args = parser.parse_args()
+
+    corpus = generate_corpus(args.files, args.size_kb)
+    read_source = conversion_pipeline.read_source
+    write_output = conversion_pipeline.write_output
+    with tempfile.TemporaryDirectory() as temp_dir:
+        input_dir = os.path.join(temp_dir, 'input')
+        output_dir = os.path.join(temp_dir, 'output')
+        write_corpus(input_dir, corpus)
+        tasks = [(input_path, output_path, False, None)
+                 for input_path, output_path in folder.collect_sql_files(input_dir, output_dir)]
+
+        print(f"{len(tasks)} files, {args.jobs} jobs, {args.latency_ms:g} ms per read/write")
+        print(f"{'io threads':>10} {'latency ms':>10} {'seconds':>8} {'files/s':>8}")
+        elapsed, _ = run(tasks, args.jobs, max(args.io_threads))
+        print(f"{max(args.io_threads):>10} {0:>10} {elapsed:8.2f} {len(tasks) / elapsed:8.1f}")
+
+        conversion_pipeline.read_source = with_latency(read_source, args.latency_ms / 1000)
+        conversion_pipeline.write_output = with_latency(write_output, args.latency_ms / 1000)
+        try:
+            for io_threads in args.io_threads:
+                elapsed, failed = run(tasks, args.jobs, io_threads)
+                note = f"  ({failed} failed)" if failed else ''
+                print(f"{io_threads:>10} {args.latency_ms:>10g} {elapsed:8.2f} {len(tasks) / elapsed:8.1f}{note}")
+        finally:
+            conversion_pipeline.read_source = read_source
+            conversion_pipeline.write_output = write_output
+
+
+if __name__ == '__main__':
+    main()
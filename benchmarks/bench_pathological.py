@@ -0,0 +1,81 @@
+"""Run every regex and parser rule against pathological inputs and check the time budget keeps each one bounded.
+
+Usage: python benchmarks/bench_pathological.py [lines] [budget_seconds]
+
+Exits with status 1 if any rule overran its budget, i.e. the guard failed.
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import tsql_rules
+from tsql_rules import ParserRule, Rule, collect_skipped_rules, list_rules, set_rule_time_budget
+
+# Each input repeats a line that opens a lazy DOTALL span or an unbalanced
+# construct without ever closing it, the worst case for backtracking.
+PATHOLOGICAL_LINES = {
+    'case_without_end': "    ,flag_{i} = CASE WHEN a.x = {i} THEN 'Y'\n",
+    'on_without_join': "    ON a.id_{i} = b.id AND a.x AS y\n",
+    'call_without_endcall': "{{% call statement('s{i}') %}} SELECT a_{i} FROM t\n",
+    'unclosed_functions': "    ,col_{i} = COALESCE(LEFT(CONVERT(VARCHAR(10), a.x_{i}\n",
+    'hashbytes_unclosed': "    ,hk_{i} = CONVERT(BINARY(32), HASHBYTES('MD5', a.x_{i} + '|'\n",
+    'alias_chain': "    ,a_{i} = b_{i}.c = d = e\n",
+    'whitespace_runs': "    ON" + " " * 200 + "x_{i}\n",
+    'backtick_runs': "    ,`a_{i}`.`b` = `c\n",
+}
+
+
+def make_input(name, lines):
+    template = PATHOLOGICAL_LINES[name]
+    return 'SELECT 1\n' + ''.join(template.format(i=i) for i in range(lines))
+
+
+def run_rule(rule, sql):
+    with collect_skipped_rules() as skipped:
+        start = time.perf_counter()
+        tsql_rules.apply_rule_group(sql, rule.group)
+        elapsed = time.perf_counter() - start
+    return elapsed, skipped
+
+
+def main():
+    lines = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    budget = float(sys.argv[2]) if len(sys.argv) > 2 else 1.0
+    set_rule_time_budget(budget)
+    # Allow for the rules that run before the slow one in the same group
+    limit = budget * 1.5 + 0.5
+
+    regex_rules = [rule for rule in list_rules() if isinstance(rule, (Rule, ParserRule))]
+    failures = []
+    print(f"{'rule':36} {'worst input':24} {'seconds':>8}  timed out on")
+    for rule in regex_rules:
+        # Run the rule on its own so the group timing is the rule timing
+        others = [other for other in list_rules(rule.group) if other is not rule]
+        for other in others:
+            other.enabled = False
+        worst = (0.0, None)
+        timed_out = []
+        try:
+            for name in PATHOLOGICAL_LINES:
+                elapsed, skipped = run_rule(rule, make_input(name, lines))
+                if skipped:
+                    timed_out.append(name)
+                if elapsed > worst[0]:
+                    worst = (elapsed, name)
+        finally:
+            for other in others:
+                other.enabled = True
+        if worst[0] > limit:
+            failures.append(rule.name)
+        print(f"{rule.name:36} {worst[1] or '-':24} {worst[0]:>8.3f}  {', '.join(timed_out)}")
+
+    if failures:
+        print(f"\nUnbounded rules (over {limit:.1f}s): {', '.join(failures)}")
+        sys.exit(1)
+    print(f"\nAll {len(regex_rules)} rules stayed within {limit:.1f}s on {lines} line inputs")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""Time cold starts of the single-file CLI, the way a pre-commit hook runs it.
+
+Usage:
+    python benchmarks/bench_startup.py [--repeat N] [--max-ms MS] [--imports N]
+
+Runs `python convert_tsql_to_databricks.py model.sql out.sql` on a small
+model N times and reports the best and median wall time next to a bare
+interpreter start, so the converter's own share is visible. --max-ms fails
+the run if the median converter start is slower than MS. --imports lists
+the N slowest imports from `python -X importtime`.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+CONVERTER = os.path.join(os.path.dirname(BENCHMARK_DIR), 'convert_tsql_to_databricks.py')
+
+MODEL = """{{ config(materialized='table', alias='startup') }}
+
+SELECT
+    customer_id = c.[id]
+    ,full_name = ISNULL(c.[first_name], '') + ' ' + ISNULL(c.[last_name], '')
+    ,created = CONVERT(datetime2(7), c.created_at)
+FROM {{ ref('customers') }} c WITH (NOLOCK)
+"""
+
+
+def time_runs(command, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(command, check=True, stdout=subprocess.DEVNULL)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def slowest_imports(command, count):
+    """Return (cumulative ms, module) for the slowest top level imports"""
+    result = subprocess.run([command[0], '-X', 'importtime'] + command[1:], check=True,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    imports = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, module = line.split('|')
+        # Nested imports are indented, only count the ones the script itself triggers
+        if not module.startswith('  '):
+            imports.append((int(cumulative) / 1000, module.strip()))
+    return sorted(imports, reverse=True)[:count]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the converter CLI cold start")
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--max-ms', type=float, help="fail if the median converter run is slower than this")
+    parser.add_argument('--imports', type=int, default=8, help="number of slowest imports to list")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        model_path = os.path.join(temp_dir, 'model.sql')
+        with open(model_path, 'w') as f:
+            f.write(MODEL)
+        command = [sys.executable, CONVERTER, model_path, os.path.join(temp_dir, 'out.sql')]
+
+        # One untimed run so the bytecode cache is warm, like a hook run after the first
+        time_runs(command, 1)
+        interpreter = time_runs([sys.executable, '-c', 'pass'], args.repeat)
+        converter = time_runs(command, args.repeat)
+        imports = slowest_imports(command, args.imports)
+
+    print(f"{'':28} {'best ms':>8} {'median ms':>10}")
+    print(f"{'python -c pass':28} {min(interpreter):8.1f} {statistics.median(interpreter):10.1f}")
+    print(f"{'convert_tsql_to_databricks':28} {min(converter):8.1f} {statistics.median(converter):10.1f}")
+    print(f"\nConverter overhead (median): {statistics.median(converter) - statistics.median(interpreter):.1f} ms")
+
+    print("\nSlowest imports:")
+    for milliseconds, module in imports:
+        print(f"  {milliseconds:7.1f} ms  {module}")
+
+    if args.max_ms is not None and statistics.median(converter) > args.max_ms:
+        print(f"\nMedian start {statistics.median(converter):.1f} ms is over the {args.max_ms:g} ms budget")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+"""Generate synthetic TSQL dbt models for benchmarking.
+
+Usage: python benchmarks/corpus.py output_dir [--files N] [--size-kb N] [--mix convert=1,alias=2,...] [--seed N]
+
+Every model is a chain of CTEs whose select lists are built from the column
+kinds in FEATURES, weighted by the mix. The same seed always gives the same
+corpus, so timings stay comparable between runs.
+"""
+import argparse
+import os
+import random
+
+# Column kind -> template. {i} is a running column number, {t} the table alias.
+FEATURES = {
+    # Nested CONVERT/HASHBYTES surrogate keys and CONVERT/COALESCE business keys
+    'convert': [
+        ",sk_{i} = CONVERT(BINARY(32), HASHBYTES('SHA2_256', CONVERT(NVARCHAR(100), {t}.id_{i}) + '|' + 'src'))",
+        ",bk_{i} = CONVERT(VARCHAR(100), COALESCE(CONVERT(NVARCHAR(50), {t}.code_{i}), '-1'))",
+        ",hk_{i} = HASHBYTES('MD5', {t}.name_{i})",
+        ",ts_{i} = CONVERT(datetime2(7), {t}.created_{i})",
+    ],
+    # alias = expression columns
+    'alias': [
+        ",col_{i} = {t}.col_{i}",
+        ",full_{i} = CONCAT({t}.first_{i}, ' ', {t}.last_{i})",
+        ",nm_{i} = ISNULL({t}.name_{i}, 'n/a')",
+        ",amt_{i} = CAST({t}.amt_{i} AS NUMERIC(18,2))",
+    ],
+    # Bracketed and quoted identifiers
+    'brackets': [
+        ",{t}.[Column {i}] AS [column_{i}]",
+        ",\"Quoted {i}\" = {t}.[quoted_{i}]",
+        ",{t}.[flag_{i}]",
+    ],
+    # CASE blocks, with and without a leading alias
+    'case': [
+        ",flag_{i} = CASE\n            WHEN {t}.[x_{i}] = 1 THEN 'Y'\n            WHEN {t}.[x_{i}] = 2 THEN 'N'\n            ELSE 'U'\n        END",
+        ",CASE WHEN LEFT({t}.[gender_{i}], 1) = 'M' THEN 1 ELSE 9 END AS sex_{i}",
+    ],
+    'plain': [
+        ",{t}.col_{i}",
+        ",{t}.col_{i} AS renamed_{i}",
+    ],
+}
+
+DEFAULT_MIX = {'convert': 1, 'alias': 2, 'brackets': 1, 'case': 1, 'plain': 1}
+
+CONFIG_BLOCK = """{{{{ config(materialized='incremental', unique_key='id', alias='model_{n}', tags=['bench'], enabled=true) }}}}
+
+"""
+
+
+def parse_mix(text):
+    """Parse 'convert=1,alias=2' into a weight per feature, jinja=0 drops the config block"""
+    mix = {}
+    for item in text.split(','):
+        name, _, weight = item.partition('=')
+        name = name.strip()
+        if name != 'jinja' and name not in FEATURES:
+            raise ValueError(f"Unknown feature: {name}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def generate_model(rng, n, size_bytes, mix=None):
+    """Return one synthetic model of roughly size_bytes characters"""
+    mix = mix or DEFAULT_MIX
+    kinds = [kind for kind in FEATURES if mix.get(kind, 0) > 0]
+    weights = [mix[kind] for kind in kinds]
+
+    parts = []
+    if mix.get('jinja', 1) > 0:
+        parts.append(CONFIG_BLOCK.format(n=n))
+    parts.append("WITH ")
+    size = sum(len(part) for part in parts)
+    column = 0
+    cte = 0
+    while size < size_bytes or cte == 0:
+        table = f"t{cte}"
+        lines = [f"cte_{cte} AS (\n    SELECT\n        {table}.id"]
+        for _ in range(rng.randint(8, 24)):
+            template = rng.choice(FEATURES[rng.choices(kinds, weights)[0]])
+            lines.append("        " + template.format(i=column, t=table))
+            column += 1
+        lines.append(f"    FROM {{{{ ref('source_{n}_{cte}') }}}} {table} WITH (NOLOCK)")
+        lines.append(f"    LEFT JOIN dbo.[dim_{cte}] d{cte} ON d{cte}.id = {table}.id AND d{cte}.active = 1")
+        lines.append(f"    WHERE {table}.updated >= DATEADD(DAY, -1, GETDATE())\n)")
+        block = "\n".join(lines)
+        if cte:
+            block = ",\n" + block
+        parts.append(block)
+        size += len(block)
+        cte += 1
+    parts.append(f"\nSELECT * FROM cte_{cte - 1}\n")
+    return ''.join(parts)
+
+
+def generate_corpus(files=50, size_kb=20, mix=None, seed=42):
+    """Return a list of (relative path, model text)"""
+    rng = random.Random(seed)
+    corpus = []
+    for n in range(files):
+        # Vary model sizes around the target like a real project
+        size = int(size_kb * 1024 * rng.uniform(0.25, 1.75))
+        corpus.append((os.path.join(f"folder_{n % 5}", f"model_{n}.sql"), generate_model(rng, n, size, mix)))
+    return corpus
+
+
+def write_corpus(output_dir, corpus):
+    for relative_path, text in corpus:
+        path = os.path.join(output_dir, relative_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            f.write(text)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic TSQL dbt model corpus")
+    parser.add_argument('output_dir')
+    parser.add_argument('--files', type=int, default=50)
+    parser.add_argument('--size-kb', type=float, default=20, help="average model size")
+    parser.add_argument('--mix', type=parse_mix, default=None,
+                        help="feature weights, e.g. convert=1,alias=2,brackets=1,case=1,plain=1,jinja=1")
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    corpus = generate_corpus(args.files, args.size_kb, args.mix, args.seed)
+    write_corpus(args.output_dir, corpus)
+    total = sum(len(text) for _, text in corpus)
+    print(f"Wrote {len(corpus)} models, {total / 1024:.0f} KB, to {args.output_dir}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+import hashlib
+import json
+import os
+import convert_tsql_to_databricks
+import lowercase_all
+import tsql_lexer
+import tsql_parser
+import tsql_rules
+
+__all__ = [
+    'MANIFEST_NAME',
+    'converter_version',
+    'file_hash',
+    'OutputDigest',
+    'output_hash',
+    'load_manifest',
+    'save_manifest'
+]
+
+# Lives in the root of the output folder
+MANIFEST_NAME = '.tsql_to_databricks_manifest.json'
+
+# Modules whose source changes must invalidate every cached output
+CONVERTER_MODULES = (convert_tsql_to_databricks, lowercase_all, tsql_lexer, tsql_parser, tsql_rules)
+
+
+def converter_version():
+    """Hash of the converter source and the enabled rule set"""
+    digest = hashlib.sha256()
+    for module in CONVERTER_MODULES:
+        with open(module.__file__, 'rb') as f:
+            digest.update(f.read())
+    digest.update(tsql_rules.ruleset_fingerprint().encode('ascii'))
+    return digest.hexdigest()
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# Lines convert_tsql_to_databricks.conversion_header writes, they differ on every run
+HEADER_PREFIXES = (b'-- converted on:', b'-- command:')
+
+
+class OutputDigest:
+    """Binary file-like sink hashing what is written to it, skipping the conversion header lines
+
+    Hashes the same as output_hash of a file with the same content, so a
+    conversion can be checked against an existing output without writing it.
+    """
+
+    def __init__(self):
+        self.digest = hashlib.sha256()
+        self.pending = b''
+        self.in_header = True
+
+    def write(self, data):
+        size = len(data)
+        if self.in_header:
+            self.pending += data
+            while self.in_header and b'\n' in self.pending:
+                line, self.pending = self.pending.split(b'\n', 1)
+                if not line.lower().startswith(HEADER_PREFIXES):
+                    self.in_header = False
+                    self.pending = line + b'\n' + self.pending
+            if self.in_header:
+                return size
+            data, self.pending = self.pending, b''
+        self.digest.update(data)
+        return size
+
+    def hexdigest(self):
+        if self.in_header and self.pending:
+            # Output without a newline after the header
+            self.digest.update(b'' if self.pending.lower().startswith(HEADER_PREFIXES) else self.pending)
+            self.pending = b''
+        return self.digest.hexdigest()
+
+
+def output_hash(path):
+    """sha256 of a converted output file without its header, which embeds the time and command line"""
+    digest = OutputDigest()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.write(block)
+    return digest.hexdigest()
+
+
+def load_manifest(output_dir, version=None):
+    """Return {input relative path: entry} from the last run, or {} if it cannot be reused
+
+    With version None the entries are returned whatever converter wrote
+    them, e.g. to look up the options of the last run.
+    """
+    path = os.path.join(output_dir, MANIFEST_NAME)
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if version is not None and manifest.get('version') != version:
+        return {}
+    return manifest.get('files', {})
+
+
+def save_manifest(output_dir, version, files):
+    """Write the manifest atomically so an interrupted run never leaves it half written"""
+    path = os.path.join(output_dir, MANIFEST_NAME)
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump({'version': version, 'files': files}, f, indent=1, sort_keys=True)
+    os.replace(temp_path, path)
@@ -0,0 +1,76 @@
+import threading
+from collections import OrderedDict
+from multiprocessing.managers import BaseManager
+
+__all__ = [
+    'ConversionMemo',
+    'start_shared_memo'
+]
+
+# Statements kept by default, most dbt statements are a few KB
+DEFAULT_MEMO_SIZE = 4096
+
+
+class ConversionMemo:
+    """Bounded LRU cache of converted statements with hit counting
+
+    Keys are (options, statement text without surrounding whitespace),
+    values whatever the caller stores (see convert_sql). All methods are
+    thread safe, so one instance can be served to worker processes through
+    start_shared_memo.
+    """
+
+    def __init__(self, maxsize=DEFAULT_MEMO_SIZE):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            try:
+                value = self._entries[key]
+            except KeyError:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'size': len(self._entries),
+                'maxsize': self.maxsize
+            }
+
+
+class MemoManager(BaseManager):
+    pass
+
+
+MemoManager.register('ConversionMemo', ConversionMemo, exposed=('get', 'put', 'stats'))
+
+
+def start_shared_memo(maxsize=DEFAULT_MEMO_SIZE):
+    """Start a manager process holding one ConversionMemo, returns (manager, memo proxy)
+
+    The proxy can be passed to worker processes, every lookup is a round trip
+    to the manager, which is far cheaper than converting a statement. Call
+    manager.shutdown() when done.
+    """
+    manager = MemoManager()
+    manager.start()
+    return manager, manager.ConversionMemo(maxsize)
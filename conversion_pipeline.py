@@ -0,0 +1,137 @@
+"""Overlapped read -> convert -> write pipeline for folder conversion.
+
+On a network mount every open, read and write is a round trip, and doing
+them one file at a time leaves the CPU idle most of the run. Here reads
+are prefetched by a thread pool, conversions run in the given process
+pool (or inline), and writes go back to the thread pool, all coordinated
+by an asyncio event loop through bounded queues. Results come back in
+task order.
+"""
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+__all__ = [
+    'DEFAULT_IO_THREADS',
+    'read_source',
+    'write_output',
+    'map_io',
+    'run_pipeline'
+]
+
+# Concurrent reads/writes, round trips overlap so this can be well above the CPU count
+DEFAULT_IO_THREADS = 16
+# Files read ahead of the conversions, bounds memory to this many file contents
+DEFAULT_PREFETCH = 64
+
+
+def read_source(path):
+    with open(path, 'r') as f:
+        return f.read()
+
+
+def write_output(path, text):
+    """Write text to path and return the size written in bytes"""
+    with open(path, 'w') as f:
+        f.write(text)
+        f.flush()
+        return os.fstat(f.fileno()).st_size
+
+
+def map_io(function, items, io_threads=DEFAULT_IO_THREADS):
+    """list(map(function, items)) with calls overlapped in threads, for stat/hash passes over many files"""
+    if io_threads <= 1 or len(items) <= 1:
+        return [function(item) for item in items]
+    with ThreadPoolExecutor(max_workers=io_threads) as executor:
+        return list(executor.map(function, items))
+
+
+def run_pipeline(tasks, convert, executor=None, jobs=1, read_filter=None, on_converted=None,
+                 io_threads=DEFAULT_IO_THREADS, prefetch=DEFAULT_PREFETCH):
+    """Read, convert and write tasks, returns [(result, output bytes, write error)] in task order
+
+    task[0] is the input path and task[1] the output path. convert(task,
+    content) returns (result, text), text is written to the output path
+    unless it is None. It runs in executor if one is given (so it must be
+    picklable) with jobs workers, otherwise inline in this thread, which
+    keeps the per-rule time budget working. Tasks for which
+    read_filter(task) is false, and files that can't be read, get content
+    None and convert must read them itself, e.g. to stream them or to
+    report the error as usual.
+
+    on_converted(result) is called in task order as results come in, e.g.
+    to print worker output. A failed write is returned as the write error
+    and output bytes are then None.
+    """
+    return asyncio.run(_pipeline(tasks, convert, executor, jobs, read_filter, on_converted, io_threads, prefetch))
+
+
+async def _pipeline(tasks, convert, executor, jobs, read_filter, on_converted, io_threads, prefetch):
+    loop = asyncio.get_running_loop()
+    io_executor = ThreadPoolExecutor(max_workers=io_threads, thread_name_prefix='conversion-io')
+    reads = asyncio.Queue(maxsize=prefetch)
+    # Enough conversions in flight to keep every worker busy
+    conversions = asyncio.Queue(maxsize=2 * jobs)
+    # Unwritten texts are held in memory, so writes are bounded like reads
+    write_slots = asyncio.Semaphore(prefetch)
+    results = [None] * len(tasks)
+    writes = [None] * len(tasks)
+
+    async def read_stage():
+        for index, task in enumerate(tasks):
+            future = None
+            if read_filter is None or read_filter(task):
+                future = loop.run_in_executor(io_executor, read_source, task[0])
+            await reads.put((index, task, future))
+        await reads.put(None)
+
+    async def convert_stage():
+        while True:
+            item = await reads.get()
+            if item is None:
+                break
+            index, task, future = item
+            content = None
+            if future is not None:
+                try:
+                    content = await future
+                except (OSError, UnicodeDecodeError):
+                    # Left to convert, which reads the file itself and reports the error
+                    content = None
+            if executor is None:
+                converted = loop.create_future()
+                converted.set_result(convert(task, content))
+            else:
+                converted = loop.run_in_executor(executor, convert, task, content)
+            await conversions.put((index, task, converted))
+        await conversions.put(None)
+
+    async def write_stage():
+        while True:
+            item = await conversions.get()
+            if item is None:
+                break
+            index, task, converted = item
+            result, text = await converted
+            results[index] = result
+            if on_converted is not None:
+                on_converted(result)
+            if text is not None:
+                await write_slots.acquire()
+                writes[index] = loop.run_in_executor(io_executor, write_output, task[1], text)
+                writes[index].add_done_callback(lambda _: write_slots.release())
+
+    try:
+        await asyncio.gather(read_stage(), convert_stage(), write_stage())
+        outcomes = []
+        for result, write in zip(results, writes):
+            if write is None:
+                outcomes.append((result, None, None))
+                continue
+            try:
+                outcomes.append((result, await write, None))
+            except OSError as e:
+                outcomes.append((result, None, e))
+        return outcomes
+    finally:
+        io_executor.shutdown(wait=True)
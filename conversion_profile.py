@@ -0,0 +1,77 @@
+import csv
+import json
+
+__all__ = [
+    'total_stats',
+    'write_profile_report',
+    'print_profile_summary'
+]
+
+STAT_FIELDS = ['seconds', 'matches', 'bytes_changed']
+
+
+def total_stats(records, kind):
+    """Sum the per file stats of one kind ('transforms' or 'rules') over all records"""
+    totals = {}
+    for record in records:
+        for name, stats in record[kind].items():
+            total = totals.setdefault(name, {'group': stats['group'], 'seconds': 0.0,
+                                             'matches': 0, 'bytes_changed': 0, 'files': 0})
+            for field in STAT_FIELDS:
+                total[field] += stats[field]
+            if stats['matches']:
+                total['files'] += 1
+    return totals
+
+
+def write_profile_report(path, records):
+    """Write the per file profile as CSV if path ends in .csv, JSON otherwise
+
+    The CSV has one row per file, kind ('file', 'transform' or 'rule') and
+    name. The JSON holds the per file records plus totals over all files.
+    """
+    if path.lower().endswith('.csv'):
+        with open(path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['file', 'kind', 'name', 'group'] + STAT_FIELDS + ['bytes'])
+            for record in records:
+                writer.writerow([record['file'], 'file', '', '', f"{record['seconds']:.6f}", '', '',
+                                 record['bytes']])
+                for name, stats in record['transforms'].items():
+                    writer.writerow([record['file'], 'transform', name, '', f"{stats['seconds']:.6f}",
+                                     '', '', ''])
+                for name, stats in record['rules'].items():
+                    writer.writerow([record['file'], 'rule', name, stats['group'], f"{stats['seconds']:.6f}",
+                                     stats['matches'], stats['bytes_changed'], ''])
+        return
+
+    report = {
+        'files': records,
+        'transforms': total_stats(records, 'transforms'),
+        'rules': total_stats(records, 'rules')
+    }
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=1)
+
+
+def print_profile_summary(records, top=10):
+    """Print the top slowest files, transforms and rules"""
+    if not records:
+        return
+    print(f"\nSlowest {min(top, len(records))} files:")
+    for record in sorted(records, key=lambda record: record['seconds'], reverse=True)[:top]:
+        print(f"  {record['seconds']:9.3f}s {record['bytes'] / 1024:9.0f} KB  {record['file']}")
+
+    transforms = total_stats(records, 'transforms')
+    print(f"\nSlowest {min(top, len(transforms))} transforms:")
+    for name, stats in sorted(transforms.items(), key=lambda item: item[1]['seconds'], reverse=True)[:top]:
+        print(f"  {stats['seconds']:9.3f}s  {name}")
+
+    # Keyword rules share one scan, their time shows up on apply_keyword_rules
+    rules = total_stats(records, 'rules')
+    print(f"\nSlowest {min(top, len(rules))} rules:")
+    print(f"  {'seconds':>10} {'matches':>9} {'changed':>10} {'files':>6}  rule")
+    for name, stats in sorted(rules.items(), key=lambda item: (item[1]['seconds'], item[1]['matches']),
+                              reverse=True)[:top]:
+        print(f"  {stats['seconds']:9.3f}s {stats['matches']:9} {stats['bytes_changed']:9}B "
+              f"{stats['files']:6}  {stats['group']}.{name}")
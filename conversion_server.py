@@ -0,0 +1,130 @@
+"""Long running converter that answers JSON-lines requests, so editors and
+hooks don't pay interpreter start and regex compilation per model.
+
+Each request is one JSON object per line:
+
+    {"id": 1, "sql": "SELECT a = ISNULL(b, 0) FROM t", "options": {"lowercase": "code"}}
+
+options are the ConversionOptions fields (dbt_config, disabled_rules,
+lowercase), all optional. Each response is one JSON line with the same id:
+
+    {"id": 1, "sql": "...", "dbt_config": null, "skipped_rules": [], "diagnostics": [], "applied_rules": [...],
+     "untriggered_rules": 0}
+
+or {"id": 1, "error": "..."} if the request could not be handled.
+"""
+import argparse
+import json
+import os
+import socketserver
+import stat
+import sys
+from convert_tsql_to_databricks import ConversionOptions, convert_sql
+from tsql_rules import RULE_TIME_BUDGET, list_rules, set_rule_time_budget
+
+__all__ = [
+    'handle_request',
+    'serve_stream',
+    'serve_socket'
+]
+
+# Compiles the token scanner and warms the regex caches before the first request
+WARMUP_SQL = "{{ config(materialized='table') }}\nSELECT a = ISNULL([b], 0) + c FROM t WITH (NOLOCK)"
+
+
+def parse_options(options):
+    if not isinstance(options, dict):
+        raise ValueError("options must be an object")
+    unknown = set(options) - set(ConversionOptions._fields)
+    if unknown:
+        raise ValueError(f"Unknown options: {', '.join(sorted(unknown))}")
+    known_rules = {rule.name for rule in list_rules()}
+    for name in options.get('disabled_rules', ()):
+        if name not in known_rules:
+            raise ValueError(f"Unknown rule: {name}")
+    return ConversionOptions(**options)
+
+
+def handle_request(line):
+    """Convert one JSON request line and return the response as a dict"""
+    request_id = None
+    response = {}
+    try:
+        request = json.loads(line)
+        if not isinstance(request, dict):
+            raise ValueError("request must be a JSON object")
+        request_id = request.get('id')
+        sql = request.get('sql')
+        if not isinstance(sql, str):
+            raise ValueError("request needs a 'sql' string")
+        result = convert_sql(sql, parse_options(request.get('options', {})))
+        response.update(result._asdict())
+    except Exception as e:
+        response['error'] = f"{type(e).__name__}: {e}"
+    return {'id': request_id, **response}
+
+
+def serve_stream(input_file, output_file):
+    """Answer requests from a text stream until it ends, one response line per request line"""
+    for line in input_file:
+        if not line.strip():
+            continue
+        output_file.write(json.dumps(handle_request(line)) + '\n')
+        output_file.flush()
+
+
+class ConversionRequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            response = json.dumps(handle_request(line.decode('utf-8'))) + '\n'
+            self.wfile.write(response.encode('utf-8'))
+
+
+class ConversionServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    # Each client gets its own thread, clients don't wait on each other
+    daemon_threads = True
+
+
+def serve_socket(path):
+    """Answer requests from any number of concurrent clients on a Unix socket at path
+
+    Conversions run in client threads, where the per-rule time budget can't
+    interrupt a rule (see tsql_rules.apply_rule_group). A socket left at
+    path by an earlier server is replaced, anything else raises
+    FileExistsError.
+    """
+    if os.path.lexists(path):
+        if not stat.S_ISSOCK(os.lstat(path).st_mode):
+            raise FileExistsError(f"Not a socket, refusing to replace it: {path}")
+        os.remove(path)
+    with ConversionServer(path, ConversionRequestHandler) as server:
+        print(f"Listening on {path}", file=sys.stderr)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            os.remove(path)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Serve TSQL to Databricks conversions over JSON lines")
+    parser.add_argument('--socket', metavar='PATH',
+                        help="listen on a Unix socket instead of reading requests from stdin")
+    parser.add_argument('--rule-timeout', type=float, default=RULE_TIME_BUDGET, metavar='SECONDS',
+                        help="per rule time budget in stdin mode (0 = no limit, default: "
+                             f"{RULE_TIME_BUDGET:g}), socket clients run without one")
+    args = parser.parse_args()
+
+    set_rule_time_budget(args.rule_timeout)
+    convert_sql(WARMUP_SQL)
+    if args.socket:
+        try:
+            serve_socket(args.socket)
+        except OSError as e:
+            print(f"Error: {e}", file=sys.stderr)
+            sys.exit(2)
+    else:
+        serve_stream(sys.stdin, sys.stdout)
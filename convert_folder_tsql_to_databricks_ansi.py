@@ -1,60 +1,752 @@
+import argparse
+import contextlib
+import fnmatch
+import functools
+import io
+import mmap
 import os
 import shutil
+import subprocess
 import sys
-from datetime import datetime
-from convert_tsql_to_databricks import convert_tsql_to_databricks
-from lowercase_all import lowercase_sql_files
+import time
+from collections import Counter, namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from conversion_memo import DEFAULT_MEMO_SIZE, ConversionMemo, start_shared_memo
+from conversion_cache import (OutputDigest, converter_version, file_hash, load_manifest, output_hash,
+                              save_manifest)
+from conversion_pipeline import DEFAULT_IO_THREADS, map_io, read_source, run_pipeline, write_output
+from conversion_profile import print_profile_summary, write_profile_report
+from convert_tsql_to_databricks import (PARALLEL_CHUNK_SIZE, ConversionOptions, configure_rules, conversion_header,
+                                        convert_file_content, convert_mapped_file,
+                                        process_sql_file as convert_sql_file, warn_skipped_rules)
+from lowercase_all import LOWERCASE_MODES
+from run_report import print_run_summary, write_run_report
+from tsql_rules import RULE_TIME_BUDGET, collect_rule_stats, list_rules
 
-def process_sql_file(input_path, output_path):
-    """Process a single SQL file with proper error handling"""
+# Statement memo shared by the conversions of this process, see init_worker
+_memo = None
+
+def process_sql_file(input_path, output_path, stream=False, lowercase=None, quiet=False, trace_in_output=True):
+    """Convert a single SQL file with proper error handling, returns its run report record
+
+    The status is 'converted' only if every rule ran, i.e. no error and no
+    rule skipped for exceeding its time budget.
+    """
+    return convert_sql_file(input_path, output_path, stream=stream, options=ConversionOptions(lowercase=lowercase),
+                            quiet=quiet, trace_in_output=trace_in_output, memo=_memo)
+
+def profile_sql_file(input_path, output_path, stream=False, lowercase=None, quiet=False, trace_in_output=True):
+    """Run process_sql_file while recording per rule stats, returns (report record, profile record)"""
+    start = time.perf_counter()
+    with collect_rule_stats() as stats:
+        report = process_sql_file(input_path, output_path, stream, lowercase, quiet, trace_in_output)
+    record = {
+        'file': input_path,
+        'seconds': time.perf_counter() - start,
+        'bytes': os.path.getsize(input_path),
+        'transforms': stats['transforms'],
+        'rules': stats['rules']
+    }
+    return report, record
+
+def convert_task(task, profile=False, quiet=False, trace_in_output=True):
+    """Convert one (input, output, stream, lowercase) task, returns (report record, profile record or None)"""
+    if profile:
+        return profile_sql_file(*task, quiet=quiet, trace_in_output=trace_in_output)
+    return process_sql_file(*task, quiet=quiet, trace_in_output=trace_in_output), None
+
+def convert_content(task, content, profile=False, quiet=False, trace_in_output=True, executor=None, jobs=1,
+                    output=None):
+    """Convert one task's content read by the pipeline, returns ((report record, profile record or None), output text)
+
+    Tasks without content (streamed, or unreadable so the error is reported
+    as usual) are converted from their input file, which also writes the
+    output, so the text is None. With an executor the content is split over
+    its jobs workers (see convert_tsql_to_databricks.convert_sql_parallel).
+    Console lines of content conversions go to output, stdout by default.
+    """
+    if content is None:
+        return convert_task(task, profile, quiet, trace_in_output), None
+    input_path, output_path, stream, lowercase = task
+    options = ConversionOptions(lowercase=lowercase)
+    if not profile:
+        report, text = convert_file_content(content, input_path, output_path, options, quiet, trace_in_output, _memo,
+                                            executor, jobs, output)
+        return (report, None), text
+    start = time.perf_counter()
+    with collect_rule_stats() as stats:
+        report, text = convert_file_content(content, input_path, output_path, options, quiet, trace_in_output, _memo,
+                                            output=output)
+    record = {
+        'file': input_path,
+        'seconds': time.perf_counter() - start,
+        'bytes': report['input_bytes'],
+        'transforms': stats['transforms'],
+        'rules': stats['rules']
+    }
+    return (report, record), text
+
+def convert_content_captured(task, content, profile=False, quiet=False, trace_in_output=True):
+    """Run convert_content and return ((report, profile record, console output), text) instead of printing"""
+    buffer = io.StringIO()
+    with contextlib.redirect_stdout(buffer):
+        (report, record), text = convert_content(task, content, profile, quiet, trace_in_output)
+    return (report, record, buffer.getvalue()), text
+
+def convert_split(task, executor, jobs, quiet=False, trace_in_output=True):
+    """Convert one large script over the jobs workers of executor, returns an outcome like run_pipeline's
+
+    Runs in a thread of this process next to the pipeline, so console
+    output is collected without touching sys.stdout.
+    """
     try:
-        print(f"Processing: {input_path}")
-        convert_tsql_to_databricks(input_path, output_path)
-        print(f"Successfully converted {input_path}")
-    except Exception as e:
-        print(f"Error converting {input_path}")
-        print(f"Error details: {str(e)}")
-        print(f"Error type: {type(e)}")
-        import traceback
-        trace = traceback.format_exc()
-        formatted_trace = trace.replace('\n', '\n-- ')
-        with open(output_path, 'w') as f:
-            now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            f.write(f'-- Error during conversion on: {now}\n')
-            f.write(f'-- Error: {str(e)}\n')
-            f.write(f'-- Stack trace:\n-- {formatted_trace}\n')
-            f.write(f'-- Original file: {input_path}\n')
-
-def process_directory(input_dir, output_dir):
-    """Process all SQL files in directory and subdirectories"""
+        content = read_source(task[0])
+    except (OSError, UnicodeDecodeError):
+        content = None
+    if content is None:
+        # Converted from the file in a worker, which reports the error as usual
+        return executor.submit(convert_content_captured, task, None, quiet=quiet,
+                               trace_in_output=trace_in_output).result()[0], None, None
+    buffer = io.StringIO()
+    (report, record), text = convert_content(task, content, quiet=quiet, trace_in_output=trace_in_output,
+                                             executor=executor, jobs=jobs, output=buffer)
+    result = report, record, buffer.getvalue()
+    try:
+        return result, write_output(task[1], text), None
+    except OSError as e:
+        return result, None, e
+
+# Which files of the input folder a run converts, None fields select everything.
+# include/exclude: glob patterns matched against the path relative to the input
+#                  folder ('/' separated, * also matches across folders)
+# paths: relative paths to convert (e.g. from a file list or git), instead of walking the folder
+FileSelection = namedtuple('FileSelection', ['include', 'exclude', 'paths'], defaults=[None, None, None])
+
+def is_selected(selection, relative_path):
+    """Whether a path relative to the input folder is part of selection (None selects everything)"""
+    if selection is None:
+        return True
+    path = relative_path.replace(os.sep, '/')
+    if selection.paths is not None and relative_path not in selection.paths:
+        return False
+    if selection.include and not any(fnmatch.fnmatch(path, pattern) for pattern in selection.include):
+        return False
+    return not (selection.exclude and any(fnmatch.fnmatch(path, pattern) for pattern in selection.exclude))
+
+def normalize_paths(input_dir, paths):
+    """Paths relative to input_dir (or absolute) as the set of relative paths is_selected expects
+
+    Raises ValueError for a path outside input_dir, its output would land outside the output folder.
+    """
+    normalized = set()
+    for path in paths:
+        relative = os.path.normpath(os.path.relpath(path, input_dir) if os.path.isabs(path) else path)
+        if not is_inside(relative):
+            raise ValueError(f"Path is outside the input directory: {path}")
+        normalized.add(relative)
+    return normalized
+
+def is_inside(relative_path):
+    """Whether a normalized relative path stays inside the folder it is relative to"""
+    return not (os.path.isabs(relative_path) or relative_path == '..' or relative_path.startswith('..' + os.sep))
+
+def read_file_list(path):
+    """Paths from a file with one path per line, or from stdin if path is -"""
+    if path == '-':
+        return [line.strip() for line in sys.stdin if line.strip()]
+    with open(path, 'r') as f:
+        return [line.strip() for line in f if line.strip()]
+
+def git_changed_files(input_dir, revision):
+    """Paths relative to input_dir that changed since revision in the git work tree containing it
+
+    Committed and uncommitted changes and untracked files count. Deleted
+    and renamed files are listed under their old path too, so their outputs
+    can be removed.
+    """
+    def git(*args):
+        return subprocess.run(['git', *args], cwd=input_dir, check=True, capture_output=True,
+                              text=True).stdout.splitlines()
+
+    changed = git('diff', '--name-only', '--no-renames', '--relative', revision, '--', '.')
+    untracked = git('ls-files', '--others', '--exclude-standard')
+    return [path for path in changed + untracked if path]
+
+def collect_sql_files(input_dir, output_dir, lowercase=None, mirror=True, selection=None):
+    """Mirror the folder structure into output_dir and list (input, output) pairs for every SQL file
+
+    With lowercase set the output file names are lowercased. mirror=False
+    only lists the pairs, without creating any folders. With a
+    FileSelection only the selected files are listed, and only their
+    folders mirrored. When it names the paths the folder isn't walked at all.
+    """
+    if selection is not None and selection.paths is not None:
+        tasks = []
+        for relative_path in sorted(selection.paths):
+            if not is_inside(os.path.normpath(relative_path)):
+                raise ValueError(f"Path is outside the input directory: {relative_path}")
+            input_file_path = os.path.join(input_dir, relative_path)
+            if (not relative_path.lower().endswith('.sql') or not os.path.isfile(input_file_path)
+                    or not is_selected(selection, relative_path)):
+                continue
+            folder, file = os.path.split(relative_path)
+            output_subdir = os.path.normpath(os.path.join(output_dir, folder))
+            if mirror:
+                os.makedirs(output_subdir, exist_ok=True)
+            tasks.append((input_file_path, os.path.join(output_subdir, file.lower() if lowercase else file)))
+        return tasks
+
+    tasks = []
     for root, dirs, files in os.walk(input_dir):
         relative_path = os.path.relpath(root, input_dir)
-        output_subdir = os.path.join(output_dir, relative_path)
-        os.makedirs(output_subdir, exist_ok=True)
+        output_subdir = os.path.normpath(os.path.join(output_dir, relative_path))
+        if mirror and selection is None:
+            os.makedirs(output_subdir, exist_ok=True)
 
         for file in files:
             if file.lower().endswith('.sql'):
+                if selection is not None and not is_selected(selection,
+                                                             os.path.normpath(os.path.join(relative_path, file))):
+                    continue
+                if mirror:
+                    os.makedirs(output_subdir, exist_ok=True)
                 input_file_path = os.path.join(root, file)
-                output_file_path = os.path.join(output_subdir, file)
-                process_sql_file(input_file_path, output_file_path)
+                output_file_path = os.path.join(output_subdir, file.lower() if lowercase else file)
+                tasks.append((input_file_path, output_file_path))
+    return tasks
+
+def init_worker(disabled_rules=(), rule_timeout=RULE_TIME_BUDGET, memo=None):
+    """Process pool initializer: configure the rules and use the given statement memo"""
+    global _memo
+    configure_rules(disabled_rules, rule_timeout)
+    _memo = memo
+
+def print_output(result):
+    output = result[2]
+    if output:
+        sys.stdout.write(output)
+        sys.stdout.flush()
+
+def convert_files(tasks, jobs=1, disabled_rules=(), rule_timeout=RULE_TIME_BUDGET, profiles=None,
+                  quiet=False, trace_in_output=True, io_threads=DEFAULT_IO_THREADS):
+    """Convert (input, output, stream, lowercase) tasks and return a run report record per task
+
+    Files are read ahead and written by io_threads threads while others
+    are converted (see conversion_pipeline), so on network file systems the
+    run is bound by the conversions rather than by I/O round trips. With
+    jobs > 1 the files are converted in a process pool. Console output is
+    printed in the original file order, so the log reads exactly like a
+    serial run.
+
+    Pass a list as profiles to record per rule stats, one record per task
+    is appended to it. quiet=True drops the per file console output.
+
+    With jobs > 1, scripts of at least twice PARALLEL_CHUNK_SIZE are split
+    over all workers, their chunks converted alongside the other files, so
+    one large migration script doesn't leave the other workers idle at the
+    end of the run. Not when profiling or with a statement memo.
+    """
+    profile = profiles is not None
+    convert = functools.partial(convert_content_captured, profile=profile, quiet=quiet,
+                                trace_in_output=trace_in_output)
+    if jobs <= 1:
+        outcomes = run_pipeline(tasks, convert, read_filter=lambda task: not task[2], on_converted=print_output,
+                                io_threads=io_threads)
+    else:
+        with ProcessPoolExecutor(max_workers=jobs, initializer=init_worker,
+                                 initargs=(tuple(disabled_rules), rule_timeout, _memo)) as executor:
+            outcomes = convert_with_pool(tasks, convert, executor, jobs, profile, quiet, trace_in_output,
+                                         io_threads)
+
+    results = []
+    for (report, record, _), output_bytes, write_error in outcomes:
+        if output_bytes is not None:
+            report['output_bytes'] = output_bytes
+        if write_error is not None:
+            if not quiet:
+                print(f"Error writing {report['output']}: {write_error}")
+            report['status'] = 'error'
+            report['error'] = {'type': type(write_error).__name__, 'message': str(write_error), 'traceback': None}
+        results.append(report)
+        if profile:
+            profiles.append(record)
+    return results
+
+def convert_with_pool(tasks, convert, executor, jobs, profile, quiet, trace_in_output, io_threads):
+    """convert_files with a process pool, returns the run_pipeline outcomes in task order"""
+    large = []
+    if not profile and _memo is None:
+        def is_large(task):
+            return not task[2] and os.path.getsize(task[0]) >= 2 * PARALLEL_CHUNK_SIZE
+        large = [index for index, flag in enumerate(map_io(is_large, tasks, io_threads)) if flag]
+    rest = [index for index in range(len(tasks)) if index not in large]
+
+    # Console output is printed in task order, as far as the split scripts before it are done
+    printed = 0
+    converted = {}
+    positions = iter(rest)
+
+    def print_ready():
+        nonlocal printed
+        while printed < len(tasks):
+            if printed in split_outcomes:
+                if not split_outcomes[printed].done():
+                    return
+                result = split_outcomes[printed].result()[0]
+            elif printed in converted:
+                result = converted.pop(printed)
+            else:
+                return
+            print_output(result)
+            printed += 1
+
+    def print_in_order(result):
+        converted[next(positions)] = result
+        print_ready()
+
+    # Large scripts are split in a thread, their chunks queue up in the pool next to the other files.
+    # Two at a time, so the next one's chunks are queued while the last is put back together
+    with ThreadPoolExecutor(max_workers=2, thread_name_prefix='conversion-split') as splitter:
+        split_outcomes = {index: splitter.submit(convert_split, tasks[index], executor, jobs, quiet,
+                                                 trace_in_output)
+                          for index in large}
+        # Streamed files are read piece by piece by the conversion itself
+        rest_outcomes = iter(run_pipeline([tasks[index] for index in rest], convert, executor=executor, jobs=jobs,
+                                          read_filter=lambda task: not task[2], on_converted=print_in_order,
+                                          io_threads=io_threads))
+        for outcome in split_outcomes.values():
+            outcome.result()
+    print_ready()
+    return [split_outcomes[index].result() if index in split_outcomes else next(rest_outcomes)
+            for index in range(len(tasks))]
+
+def remove_stale_outputs(output_dir, previous, current):
+    """Delete outputs of inputs that were converted last run but no longer exist
+
+    Outputs written under another name this run (e.g. --lowercase was
+    turned on or off) are deleted too.
+    """
+    removed = []
+    for key, entry in previous.items():
+        if key in current and current[key]['output'] == entry['output']:
+            continue
+        output_file_path = os.path.join(output_dir, entry['output'])
+        if os.path.exists(output_file_path):
+            os.remove(output_file_path)
+            removed.append(output_file_path)
+    return removed
+
+def report_run(records, elapsed, run_report, profile_report, profiles, profile_top):
+    """Write the requested reports and print the final summary"""
+    if _memo is not None:
+        stats = _memo.stats()
+        print(f"\nStatement memo: {stats['hits']} hits of {stats['hits'] + stats['misses']} lookups "
+              f"({stats['hit_rate']:.0%}), {stats['size']} of {stats['maxsize']} entries used")
+    if profile_report:
+        write_profile_report(profile_report, profiles)
+        print_profile_summary(profiles, profile_top)
+        print(f"\nProfile report written to {profile_report}")
+    if run_report:
+        write_run_report(run_report, records)
+    print_run_summary(records, elapsed)
+    if run_report:
+        print(f"Run report written to {run_report}")
+
+def flag_tasks(tasks, stream_above, lowercase, io_threads=DEFAULT_IO_THREADS):
+    """Turn (input, output) pairs into (input, output, stream, lowercase) tasks
+
+    A pair may carry its own lowercase mode as a third item, see recorded_outputs.
+    """
+    def with_flags(task):
+        input_file_path, output_file_path = task[:2]
+        stream = stream_above is not None and os.path.getsize(input_file_path) > stream_above
+        return input_file_path, output_file_path, stream, task[2] if len(task) > 2 else lowercase
+
+    # Stats and hashes are round trips per file on network mounts, they are overlapped in threads
+    return map_io(with_flags, tasks, io_threads if stream_above is not None else 1)
+
+def process_directory(input_dir, output_dir, jobs=1, disabled_rules=(), rule_timeout=RULE_TIME_BUDGET,
+                      incremental=False, stream_above=None, profile_report=None, profile_top=10,
+                      lowercase=None, run_report=None, quiet=False, memo=None, io_threads=DEFAULT_IO_THREADS,
+                      selection=None):
+    """Process all SQL files in directory and subdirectories
+
+    With incremental=True a manifest of input hashes is kept in output_dir
+    and only new or changed files are converted. Outputs of deleted inputs
+    are removed. Changing the converter or the enabled rules invalidates
+    the manifest.
+
+    Files larger than stream_above bytes are converted in streaming mode.
+
+    With profile_report set, time, matches and bytes changed are recorded
+    per rule and file, written to that path (.json or .csv) and the
+    profile_top slowest files and rules are printed at the end.
+
+    With lowercase set to 'code' or 'all' (see lowercase_all.lowercase_sql)
+    output contents and file names are lowercased during the conversion,
+    instead of a separate lowercase_all.py pass.
+
+    Returns a run report record per converted file. With run_report set
+    they are also written there as JSON lines, and error tracebacks go to
+    the report instead of the output files. quiet=True prints only the
+    final summary.
+
+    With a memo (a ConversionMemo, or with jobs > 1 the proxy from
+    start_shared_memo) converted statements are shared by all workers and
+    repeated statements skip the rule pipeline. Each statement is then
+    converted on its own.
+
+    File sizes, hashes, reads and writes are spread over io_threads
+    threads, see convert_files.
+
+    With a FileSelection only the selected files are converted, outputs
+    and manifest entries of the others are left as they are. Outputs of
+    selected files that no longer exist are removed.
+    """
+    start = time.perf_counter()
+    tasks = collect_sql_files(input_dir, output_dir, lowercase, selection=selection)
+    init_worker(disabled_rules, rule_timeout, memo)
+    profiles = [] if profile_report else None
+    flagged_tasks = flag_tasks(tasks, stream_above, lowercase, io_threads)
+    if not incremental:
+        records = convert_files(flagged_tasks, jobs, disabled_rules, rule_timeout,
+                                profiles, quiet, trace_in_output=not run_report, io_threads=io_threads)
+        report_run(records, time.perf_counter() - start, run_report, profile_report, profiles, profile_top)
+        return records
+
+    # A selection that matches nothing mirrors no folders, the manifest still needs its home
+    os.makedirs(output_dir, exist_ok=True)
+    version = converter_version()
+    previous = load_manifest(output_dir, version)
+    current = {}
+    pending = []
+    def inspect(task):
+        return file_hash(task[0]), os.path.exists(task[1])
+
+    for task, (input_hash, output_exists) in zip(flagged_tasks, map_io(inspect, flagged_tasks, io_threads)):
+        input_file_path, output_file_path = task[:2]
+        key = os.path.relpath(input_file_path, input_dir)
+        entry = {
+            'hash': input_hash,
+            'output': os.path.relpath(output_file_path, output_dir),
+            'stream': task[2],
+            'lowercase': lowercase,
+            'memo': memo is not None
+        }
+        current[key] = entry
+        if previous.get(key) != entry or not output_exists:
+            pending.append((key, task))
+
+    # Files outside the selection were not looked at, their entries stay as they are
+    current.update((key, entry) for key, entry in previous.items()
+                   if key not in current and not is_selected(selection, key))
+    removed = remove_stale_outputs(output_dir, previous, current)
+    if not quiet:
+        files = 'selected files' if selection is not None else 'files'
+        print(f"Incremental run: {len(pending)} of {len(tasks)} {files} new or changed, "
+              f"{len(removed)} stale outputs removed")
+
+    records = convert_files([task for _, task in pending], jobs, disabled_rules, rule_timeout,
+                            profiles, quiet, trace_in_output=not run_report, io_threads=io_threads)
+    # Failed or partially converted files are left out of the manifest so the next run retries them
+    for (key, _), record in zip(pending, records):
+        if record['status'] != 'converted':
+            del current[key]
+    save_manifest(output_dir, version, current)
+    report_run(records, time.perf_counter() - start, run_report, profile_report, profiles, profile_top)
+    return records
+
+def verify_content(task, content):
+    """Reconvert one task in memory, returns ((input path, output hash or None, error message), None)
+
+    Streamed files are converted from the mapped input straight into the
+    hash, like convert_tsql_to_databricks_streaming would write them, so
+    nothing is held in memory or written either way.
+    """
+    input_path, output_path, stream, lowercase = task
+    options = ConversionOptions(lowercase=lowercase)
+    digest = OutputDigest()
+    try:
+        if stream:
+            digest.write(conversion_header().encode('utf-8'))
+            with open(input_path, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                skipped_rules = convert_mapped_file(data, digest, options=options, memo=_memo)
+            digest.write(warn_skipped_rules(skipped_rules, input_path, io.StringIO()).encode('utf-8'))
+            return (input_path, digest.hexdigest(), None), None
+        if content is None:
+            # The pipeline could not read it, read again to get the error
+            content = read_source(input_path)
+        report, text = convert_file_content(content, input_path, output_path, options, quiet=True,
+                                            trace_in_output=False, memo=_memo)
+    except Exception as e:
+        return (input_path, None, f"{type(e).__name__}: {e}"), None
+    if report['status'] == 'error':
+        return (input_path, None, f"{report['error']['type']}: {report['error']['message']}"), None
+    digest.write(text.encode('utf-8'))
+    return (input_path, digest.hexdigest(), None), None
+
+def find_orphaned_outputs(input_dir, output_dir, lowercase=None, selection=None, tasks=None):
+    """SQL files in output_dir that no input converts to, e.g. outputs of deleted inputs
+
+    tasks are the (input, output) pairs of every input, listed here if not
+    given. With a FileSelection only outputs whose path is selected are
+    returned.
+    """
+    if tasks is None:
+        tasks = collect_sql_files(input_dir, output_dir, lowercase, mirror=False)
+    expected = {os.path.normcase(os.path.normpath(task[1])) for task in tasks}
+    orphaned = []
+    for root, dirs, files in os.walk(output_dir):
+        dirs.sort()
+        for file in sorted(files):
+            output_file_path = os.path.normpath(os.path.join(root, file))
+            if (not file.lower().endswith('.sql') or os.path.normcase(output_file_path) in expected
+                    or not is_selected(selection, os.path.relpath(output_file_path, output_dir))):
+                continue
+            orphaned.append(output_file_path)
+    return orphaned
+
+def recorded_lowercase(output_dir):
+    """The lowercase mode most outputs in output_dir were written with, per its manifest (None if none)"""
+    modes = Counter(entry.get('lowercase') for entry in load_manifest(output_dir).values())
+    return modes.most_common(1)[0][0] if modes else None
+
+def recorded_outputs(tasks, input_dir, output_dir, lowercase=None):
+    """(input, output, lowercase) for (input, output) pairs, as the run that wrote output_dir converted them
+
+    Inputs in the manifest get the output name and lowercase mode it
+    recorded, whatever converter version wrote it. Others keep their pair
+    and get lowercase.
+    """
+    entries = load_manifest(output_dir)
+    recorded = []
+    for input_file_path, output_file_path in tasks:
+        entry = entries.get(os.path.relpath(input_file_path, input_dir))
+        if entry is None:
+            recorded.append((input_file_path, output_file_path, lowercase))
+        else:
+            recorded.append((input_file_path, os.path.join(output_dir, entry['output']), entry.get('lowercase')))
+    return recorded
+
+def verify_directory(input_dir, output_dir, jobs=1, disabled_rules=(), rule_timeout=RULE_TIME_BUDGET,
+                     stream_above=None, lowercase=None, run_report=None, memo=None, io_threads=DEFAULT_IO_THREADS,
+                     selection=None):
+    """Reconvert every SQL file in memory and compare it with the existing output tree, writing nothing
+
+    Outputs are compared by hash without their header (conversion time and
+    command line), so only files whose converted SQL would change are
+    listed. Options must match the run that wrote the outputs, e.g. the
+    same --stream-above and --memo. The lowercase mode and output name of
+    each file are taken from the manifest, lowercase only applies to files
+    it doesn't list.
+
+    Returns a record per file with file, output and status: 'unchanged',
+    'changed', 'missing' (no output yet) or 'error' (with the error
+    message), then one per output no input converts to anymore, with
+    status 'orphaned' and file None. With run_report set they are written
+    there as JSON lines. A FileSelection limits the check to the selected
+    files and outputs.
+    """
+    start = time.perf_counter()
+    all_tasks = recorded_outputs(collect_sql_files(input_dir, output_dir, lowercase, mirror=False),
+                                 input_dir, output_dir, lowercase)
+    if selection is not None:
+        selected_tasks = recorded_outputs(collect_sql_files(input_dir, output_dir, lowercase, mirror=False,
+                                                            selection=selection), input_dir, output_dir, lowercase)
+    else:
+        selected_tasks = all_tasks
+    tasks = flag_tasks(selected_tasks, stream_above, lowercase, io_threads)
+    init_worker(disabled_rules, rule_timeout, memo)
+
+    def existing_hash(task):
+        return output_hash(task[1]) if os.path.isfile(task[1]) else None
+
+    existing = map_io(existing_hash, tasks, io_threads)
+    pipeline = functools.partial(run_pipeline, tasks, verify_content, read_filter=lambda task: not task[2],
+                                 io_threads=io_threads)
+    if jobs <= 1 or len(tasks) <= 1:
+        outcomes = pipeline()
+    else:
+        with ProcessPoolExecutor(max_workers=jobs, initializer=init_worker,
+                                 initargs=(tuple(disabled_rules), rule_timeout, _memo)) as executor:
+            outcomes = pipeline(executor=executor, jobs=jobs)
+
+    records = []
+    for task, output_digest, ((_, new_digest, error), _, _) in zip(tasks, existing, outcomes):
+        if error is not None:
+            status = 'error'
+        elif output_digest is None:
+            status = 'missing'
+        else:
+            status = 'unchanged' if output_digest == new_digest else 'changed'
+        records.append({'file': task[0], 'output': task[1], 'status': status, 'error': error})
+        if status != 'unchanged':
+            print(f"{status:9} {task[0]}" + (f": {error}" if error else ''))
+    verified = len(records)
+    for output_file_path in find_orphaned_outputs(input_dir, output_dir, lowercase, selection, all_tasks):
+        records.append({'file': None, 'output': output_file_path, 'status': 'orphaned', 'error': None})
+        print(f"{'orphaned':9} {output_file_path}")
+
+    counts = {status: sum(record['status'] == status for record in records)
+              for status in ('unchanged', 'changed', 'missing', 'error', 'orphaned')}
+    if run_report:
+        write_run_report(run_report, records)
+    print(f"\nVerified {verified} files in {time.perf_counter() - start:.1f}s: {counts['changed']} changed, "
+          f"{counts['missing']} missing, {counts['error']} failed, {counts['unchanged']} unchanged, "
+          f"{counts['orphaned']} orphaned outputs")
+    return records
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Convert a folder of TSQL dbt/sql models to Databricks ANSI SQL")
+    parser.add_argument('input_directory', nargs='?')
+    parser.add_argument('output_directory', nargs='?')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help="number of worker processes (0 = one per CPU, default: 1)")
+    parser.add_argument('--disable-rule', action='append', default=[], metavar='NAME',
+                        help="skip a conversion rule, can be repeated (see --list-rules)")
+    parser.add_argument('--rule-timeout', type=float, default=RULE_TIME_BUDGET, metavar='SECONDS',
+                        help=f"skip a rule on a file once it runs longer than this (0 = no limit, default: {RULE_TIME_BUDGET:g})")
+    parser.add_argument('--stream-above', type=float, metavar='MB',
+                        help="convert files larger than this statement by statement with bounded memory")
+    parser.add_argument('--full', action='store_true',
+                        help="wipe the output directory and reconvert everything instead of only changed files")
+    parser.add_argument('--include', action='append', metavar='GLOB',
+                        help="only convert files whose path relative to input_directory matches, can be repeated "
+                             "(e.g. 'staging/*')")
+    parser.add_argument('--exclude', action='append', metavar='GLOB',
+                        help="skip files whose path relative to input_directory matches, can be repeated")
+    parser.add_argument('--files', metavar='LIST',
+                        help="only convert the files listed in LIST (- for stdin), one path per line, "
+                             "relative to input_directory or absolute")
+    parser.add_argument('--changed-since', metavar='REV',
+                        help="only convert files changed since the git revision REV (committed, uncommitted "
+                             "or untracked) and remove the outputs of deleted ones")
+    parser.add_argument('--verify', action='store_true',
+                        help="reconvert in memory and list the files whose output would change, ignoring the "
+                             "header, and the outputs no input converts to, without writing anything. Exits with "
+                             "1 if there were any")
+    parser.add_argument('--profile', metavar='REPORT',
+                        help="record time, matches and bytes changed per rule and file, and write them to "
+                             "REPORT (.json or .csv)")
+    parser.add_argument('--profile-top', type=int, default=10, metavar='N',
+                        help="number of slowest files and rules to print with --profile (default: 10)")
+    parser.add_argument('--report', metavar='PATH',
+                        help="write a JSON lines run report (status, duration, sizes, rules applied, errors "
+                             "per file) to PATH, tracebacks then go there instead of into the output files")
+    parser.add_argument('-q', '--quiet', action='store_true', help="only print the final summary")
+    parser.add_argument('--memo', type=int, nargs='?', const=DEFAULT_MEMO_SIZE, metavar='SIZE',
+                        help="reuse conversions of repeated statements across files, keeping up to SIZE "
+                             f"statements (default: {DEFAULT_MEMO_SIZE}). Rules then cannot see across statements")
+    parser.add_argument('--lowercase', nargs='?', const='code', choices=LOWERCASE_MODES,
+                        help="lowercase output contents and file names while converting (no prompt before). "
+                             "'code' (default) keeps strings, comments and Jinja as they are, 'all' lowercases everything")
+    parser.add_argument('--io-threads', type=int, default=DEFAULT_IO_THREADS, metavar='N',
+                        help="threads reading and writing files while others are converted, raise it for "
+                             f"network file systems (default: {DEFAULT_IO_THREADS})")
+    parser.add_argument('--list-rules', action='store_true',
+                        help="list the conversion rules in the order they are applied and exit")
+    args = parser.parse_args(argv)
+
+    if args.list_rules:
+        return args
+    if not args.input_directory or not args.output_directory:
+        parser.error("input_directory and output_directory are required")
+    known_rules = {rule.name for rule in list_rules()}
+    for name in args.disable_rule:
+        if name not in known_rules:
+            parser.error(f"unknown rule: {name}")
+    if args.full and (args.include or args.exclude or args.files or args.changed_since):
+        parser.error("--full wipes the whole output directory, it can't be combined with "
+                     "--include, --exclude, --files or --changed-since")
+    return args
+
+def file_selection(args):
+    """The FileSelection the command line asks for, or None to convert everything"""
+    if not (args.include or args.exclude or args.files or args.changed_since):
+        return None
+    paths = None
+    if args.files or args.changed_since:
+        paths = []
+        if args.files:
+            paths += read_file_list(args.files)
+        if args.changed_since:
+            paths += git_changed_files(args.input_directory, args.changed_since)
+        paths = normalize_paths(args.input_directory, paths)
+    return FileSelection(args.include, args.exclude, paths)
 
 if __name__ == '__main__':
-    if len(sys.argv) < 3:
-        print("Usage: python3 convert_folder_tsql_to_databricks_ansi.py input_directory output_directory")
+    if len(sys.argv) < 2:
+        print("Usage: python3 convert_folder_tsql_to_databricks_ansi.py input_directory output_directory [--jobs N]")
         sys.exit(1)
 
-    input_directory = sys.argv[1]
-    output_directory = sys.argv[2]
+    args = parse_args()
+    if args.list_rules:
+        for rule in list_rules():
+            print(f"{rule.group:32} {rule.name}")
+        sys.exit(0)
+
+    input_directory = args.input_directory
+    output_directory = args.output_directory
+    jobs = args.jobs if args.jobs > 0 else (os.cpu_count() or 1)
+    stream_above = args.stream_above * 1024 * 1024 if args.stream_above is not None else None
+
+    try:
+        selection = file_selection(args)
+    except subprocess.CalledProcessError as e:
+        print(f"Error: git {' '.join(e.cmd[1:])} failed: {e.stderr.strip()}", file=sys.stderr)
+        sys.exit(2)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(2)
+
+    manager = None
+    memo = None
+    if args.memo and jobs > 1:
+        manager, memo = start_shared_memo(args.memo)
+    elif args.memo:
+        memo = ConversionMemo(args.memo)
+
+    if args.verify:
+        records = verify_directory(input_directory, output_directory, jobs=jobs,
+                                   disabled_rules=args.disable_rule, rule_timeout=args.rule_timeout,
+                                   stream_above=stream_above, lowercase=args.lowercase, run_report=args.report,
+                                   memo=memo, io_threads=args.io_threads, selection=selection)
+        if manager is not None:
+            manager.shutdown()
+        sys.exit(1 if any(record['status'] != 'unchanged' for record in records) else 0)
+
+    # Ask about lowercase before converting: lowercasing while converting is recorded in the
+    # manifest, renaming the outputs afterwards would make the next run convert them again.
+    # The default is what the last run did, so just pressing enter reconverts nothing. Quiet and
+    # unattended runs (no terminal) take the default without asking
+    lowercase = args.lowercase
+    if not lowercase:
+        lowercase = recorded_lowercase(output_directory)
+    if not args.lowercase and not args.quiet and sys.stdin.isatty():
+        try:
+            response = input("Would you like to convert all SQL files to lowercase? "
+                             f"({'Y/n' if lowercase else 'y/N'}): ").lower().strip()
+        except EOFError:
+            response = ''
+        if response == 'y':
+            lowercase = lowercase or 'code'
+        elif response == 'n':
+            lowercase = None
+        if not lowercase:
+            print("Skipping lowercase conversion.")
 
-    if os.path.exists(output_directory):
+    if args.full and os.path.exists(output_directory):
         shutil.rmtree(output_directory)
 
-    process_directory(input_directory, output_directory)
-    
-    # Ask about lowercase conversion
-    print("\nConversion complete!")
-    response = input("Would you like to convert all SQL files to lowercase? (y/n): ").lower().strip()
-    if response == 'y':
-        lowercase_sql_files(output_directory)
-    else:
-        print("Skipping lowercase conversion.")
+    process_directory(input_directory, output_directory, jobs=jobs,
+                      disabled_rules=args.disable_rule, rule_timeout=args.rule_timeout,
+                      incremental=True, stream_above=stream_above,
+                      profile_report=args.profile, profile_top=args.profile_top, lowercase=lowercase,
+                      run_report=args.report, quiet=args.quiet, memo=memo, io_threads=args.io_threads,
+                      selection=selection)
+    if manager is not None:
+        manager.shutdown()
+
+    if not args.quiet:
+        print("\nConversion complete!")
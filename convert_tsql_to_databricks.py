@@ -1,31 +1,64 @@
+import argparse
+import functools
+import io
+import mmap
+import os
 import re
-import sqlparse
 import sys
-from sqlparse.sql import Identifier
+import time
+from collections import Counter, namedtuple
 from datetime import datetime
-import traceback
+import tsql_lexer
+import tsql_rules
+from lowercase_all import LOWERCASE_MODES, lowercase_sql
+from tsql_lexer import (apply_token_rules, iter_statement_ends, iter_statements, mask_jinja, open_parens,
+                        split_statements, unmask_jinja)
+from tsql_rules import (all_triggers, apply_rule_group, apply_token_rule_group, collect_applied_rules,
+                        collect_skipped_rules, collect_untriggered_rules, disable_rule, enabled_rules,
+                        find_triggers, list_rules, merge_rule_results, rules_disabled, run_transform,
+                        set_rule_time_budget, triggers_present)
 
 __all__ = [
+    'ConversionOptions',
+    'ConversionResult',
+    'convert_sql',
+    'convert_sql_parallel',
     'convert_tsql_to_databricks',
-    'fix_sql_formatting',
+    'convert_file_content',
     'fix_backticks',
     'process_sql_file'
 ]
 
+DBT_CONFIG_PATTERN = re.compile(r'\{\{\s*config\s*\((.*?)\)\s*\}\}', re.DOTALL)
+DBT_CONFIG_PARAM_PATTERN = re.compile(r'(\w+)\s*=\s*([^,\n\)]+)')
+
+
 def is_dbt_model(content):
     # Look for DBT config block
-    dbt_pattern = r'\{\{\s*config\s*\((.*?)\)\s*\}\}'
-    match = re.search(dbt_pattern, content, re.DOTALL)
-    return match
+    return DBT_CONFIG_PATTERN.search(content)
+
+
+def _keyword_rules(*names):
+    return [rule for rule in enabled_rules('keyword_rules') if rule.name in names]
+
+
+def apply_keyword_rules(sql):
+    """Apply every enabled keyword level rewrite (see tsql_rules) in one pass"""
+    return apply_token_rule_group(sql, 'keyword_rules')
 
 
 def remove_nolock_hint(sql):
-    return re.sub(r'\bWITH\s*\(\s*NOLOCK\s*\)', '', sql, flags=re.IGNORECASE)
+    return apply_token_rules(sql, _keyword_rules('nolock_hint'))
 
 
 def update_dbt_config(header_match):
     """Update DBT config block with only essential parameters"""
-    config_content = header_match.group(1)
+    return rewrite_dbt_config(header_match.group(1))
+
+
+# Projects repeat the same config blocks in many models
+@functools.lru_cache(maxsize=1024)
+def rewrite_dbt_config(config_content):
     params = []
     
     # Define allowed parameters and their default values
@@ -39,7 +72,7 @@ def update_dbt_config(header_match):
     }
     
     # Extract existing parameters
-    for param in re.finditer(r'(\w+)\s*=\s*([^,\n\)]+)', config_content):
+    for param in DBT_CONFIG_PARAM_PATTERN.finditer(config_content):
         key, value = param.groups()
         if key not in allowed_params:
             continue
@@ -65,231 +98,99 @@ def update_dbt_config(header_match):
 
 
 def convert_data_types(sql):
-    # Handle CONVERT statements from most specific to most generic
-    patterns = [
-        # Pattern 1: CONVERT with multiple COALESCE concatenations
-        (r'CONVERT\s*\(\s*VARCHAR\s*\(\d+\)\s*,\s*COALESCE\s*\(\s*CONVERT\s*\(\s*NVARCHAR\s*\(\d+\)\s*,\s*([^,)]+)\s*\)\s*,\s*\'([^\']+)\'\s*\)\s*\+\s*\'\|\'\s*\+\s*COALESCE\s*\(\s*CONVERT\s*\(\s*NVARCHAR\s*\(\d+\)\s*,\s*([^,)]+)\s*\)\s*,\s*\'([^\']+)\'\s*\)\s*\)',
-         lambda m: f"cast(coalesce(cast({m.group(1)} as string), '{m.group(2)}') || '|' || coalesce(cast({m.group(3)} as string), '{m.group(4)}') as string)",
-         re.IGNORECASE),
-        
-        # Pattern 2: CONVERT with string concatenation and COALESCE
-        (r'CONVERT\s*\(\s*VARCHAR\s*\(\d+\)\s*,\s*\'([^\']+)\'\s*\+\s*\'\|\'\s*\+\s*COALESCE\s*\(\s*CONVERT\s*\(\s*NVARCHAR\s*\(\d+\)\s*,\s*([^,)]+)\s*\)\s*,\s*\'([^\']+)\'\s*\)\s*\)',
-         lambda m: f"cast('{m.group(1)}' || '|' || coalesce(cast({m.group(2)} as string), '{m.group(3)}') as string)",
-         re.IGNORECASE),
-        
-        # Pattern 3: Simple CONVERT with nested COALESCE
-        (r'CONVERT\s*\(\s*VARCHAR\s*\(\d+\)\s*,\s*COALESCE\s*\(\s*CONVERT\s*\(\s*NVARCHAR\s*\(\d+\)\s*,\s*([^,)]+)\s*\)\s*,\s*\'([^\']+)\'\s*\)\s*\)',
-         lambda m: f"cast(coalesce(cast({m.group(1)} as string), '{m.group(2)}') as string)",
-         re.IGNORECASE),
-        
-        # Pattern 4: CONVERT binary
-        (r'convert\s*\(\s*binary\s*\(\s*(\d+)\s*\)\s*,\s*([^)]+)\)',
-         lambda m: f"cast({m.group(2)} as binary({m.group(1)}))",
-         re.IGNORECASE),
-        
-        # Pattern 5: CONVERT datetime2
-        (r'convert\s*\(\s*datetime2\s*\(\s*\d+\s*\)\s*,\s*([^)]+)\)',
-         lambda m: f"cast({m.group(1)} as timestamp)",
-         re.IGNORECASE),
-        
-        # Pattern 6: CAST as BIT
-        (r'cast\s*\(\s*(\d+)\s*as\s*bit\s*\)',
-         lambda m: f"cast({m.group(1)} as boolean)",
-         re.IGNORECASE),
-        
-        # Pattern 7: Generic CONVERT (catch-all)
-        (r'CONVERT\s*\(\s*(?:N?VARCHAR)\s*\([^)]+\)\s*,\s*([^)]+)\)',
-         lambda m: f"cast({m.group(1)} as string)",
-         re.IGNORECASE),
-    ]
-    
-    # Apply all patterns in order
-    for pattern, replacement, flags in patterns:
-        sql = re.sub(pattern, replacement, sql, flags=flags)
-    
-    # Handle type declarations last
-    type_conversions = [
-        # VARCHAR/NVARCHAR to string
-        (r'(?:n?varchar)\s*\(\s*(?:max|\d+)\s*\)', 'string'),
-        # TINYINT to INT
-        (r'\btinyint\b', 'int')
-    ]
-    
-    for pattern, replacement in type_conversions:
-        sql = re.sub(pattern, replacement, sql, flags=re.IGNORECASE)
-    
-    return sql
+    # CAST(n AS BIT) and VARCHAR(n) type declarations, CONVERT calls are done by convert_cast
+    return apply_rule_group(sql, 'convert_data_types')
 
 
 def convert_window_functions(sql):
     return sql
 
 def convert_dbt_vars(sql):
-    sql = re.sub(r'{% if (.+?) %}', r'{% if \1 %}', sql)
-    sql = re.sub(r'{% elif (.+?) %}', r'{% elif \1 %}', sql)
-    sql = re.sub(r'{% else %}', r'{% else %}', sql)
-    sql = re.sub(r'{% endif %}', r'{% endif %}', sql)
-    sql = re.sub(r'SYSDATETIME\(\)', 'current_timestamp()', sql, flags=re.IGNORECASE)
-    sql = re.sub(r'GETDATE\(\)', 'current_timestamp()', sql, flags=re.IGNORECASE)
-    return sql
+    # Jinja tags are passed through as-is, only the date functions change
+    return apply_token_rules(sql, _keyword_rules('getdate', 'sysdatetime'))
 
 
 
-# working 1
 def convert_equal_alias_to_as(sql):
-    """Convert = style aliases to AS syntax, excluding complex expressions"""
-    
-    def handle_complex_expression(match):
-        prefix = match.group(1) or ''  # Handle None case for first column
-        alias = match.group(2)
-        expr = match.group(3)
-        return f'{prefix}{expr} AS {alias}'
-    
-    patterns = [
-        # First column after SELECT (no comma)
-        (r'(SELECT\s+(?:DISTINCT\s+)?)\[?([A-Za-z_]\w*)\]?\s*=\s*([A-Za-z_]\w*\.[A-Za-z_]\w*)', 
-         lambda m: f'{m.group(1)}{m.group(3)} AS {m.group(2)}'),
-        
-        # Complex FLOOR/DATEDIFF pattern with whitespace preservation
-        (r'(\s*,\s*)([A-Za-z_]\w*)\s*=\s*(FLOOR\s*\(\s*DATEDIFF\s*\([^)]*\)[^)]*\))', 
-         lambda m: f'{m.group(1)}{m.group(3)} AS {m.group(2)}'),
-        
-        # Other patterns only match if not already processed
-        (r'(\s*,\s*)([A-Za-z_]\w*)\s*=\s*(CONCAT\([^)]+\))', 
-         lambda m: f'{m.group(1)}{m.group(3)} AS {m.group(2)}'),
-        
-        # CASE statement alias
-        (r'(\s*,\s*)\[?([A-Za-z_]\w*)\]?\s*=\s*(CASE\b.*?END)', 
-         lambda m: f'{m.group(1)}{m.group(3)} AS {m.group(2)}'),
-        
-        # Multi-line concatenation pattern
-        (r'(\s*,\s*)\[?([A-Za-z_]\w*)\]?\s*=\s*(COALESCE\([^)]+\)(?:\s*[\+\|]{2}\s*(?:\r?\n\s*)?COALESCE\([^)]+\))*)', 
-         lambda m: m.group(1) + ' || '.join(part.strip() for part in re.split(r'\s*[\+\|]{2}\s*', m.group(3))) + f' AS {m.group(2)}'),
-        
-        # Table qualified column reference
-        (r'(\s*,\s*)([A-Za-z_]\w*)\s*=\s*([A-Za-z_]\w*)\s*\.\s*([A-Za-z_]\w*)', 
-         lambda m: f'{m.group(1)}{m.group(3)}.{m.group(4)} AS {m.group(2)}'),
-        
-        # Function with alias before
-        (r'(\s*,\s*)\[?([A-Za-z_]\w*)\]?\s*=\s*(LEFT|COALESCE|CONVERT|ISNULL)\s*\((.*?)\)', 
-         lambda m: f'{m.group(1)}{m.group(3)}({m.group(4)}) AS {m.group(2)}'),
-        
-        # Simple column alias with brackets (must come last)
-        (r'(\s*,\s*)\[?([A-Za-z_]\w*)\]?\s*=\s*([^,\n]+)', 
-         lambda m: f'{m.group(1)}{m.group(3)} AS {m.group(2)}'),
-        
-        # Handle remaining equals with backticks
-        (r'(\s*,\s*)(`[^`]+`)\s*=\s*(`[^`]+`)', 
-         lambda m: f'{m.group(1)}{m.group(2)} AS {m.group(3)}'),
-        
-        # Handle any remaining equals between identifiers
-        (r'(\s*,\s*)([A-Za-z_][A-Za-z0-9_]*(?:\.[A-Za-z_][A-Za-z0-9_]*)?)\s*=\s*([A-Za-z_][A-Za-z0-9_]*)', 
-         lambda m: f'{m.group(1)}{m.group(2)} AS {m.group(3)}'),
-        
-        # Handle function calls with equals
-        (r'(\s*,\s*)(UPPER|LOWER|TRIM|CAST|CONVERT|COALESCE|LEFT|RIGHT)\s*\([^)]+\)\s*=\s*([A-Za-z_][A-Za-z0-9_]*)', 
-         lambda m: f'{m.group(1)}{m.group(2)} AS {m.group(3)}'),
-        
-        # Handle reverse order (alias = expression)
-        (r'(\s*,\s*)([A-Za-z_][A-Za-z0-9_]*)\s*=\s*([A-Za-z_][A-Za-z0-9_]*(?:\.[A-Za-z_][A-Za-z0-9_]*)?)', 
-         lambda m: f'{m.group(1)}{m.group(3)} AS {m.group(2)}')
-    ]
-    
-    for pattern, replacement in patterns:
-        sql = re.sub(pattern, replacement, sql, flags=re.DOTALL | re.IGNORECASE)
-    
-    return sql
+    """Convert `alias = expression` SELECT list items to `expression AS alias` (see tsql_parser)"""
+    return apply_rule_group(sql, 'convert_equal_alias_to_as')
 
 
 
 def convert_concatenation(sql):
     # Replace '+' with '||' when not within single quotes
-    sql = re.sub(r'(?<!\')\s*\+\s*(?!\')', ' || ', sql)
-    return sql
+    return apply_token_rules(sql, _keyword_rules('concatenation'))
 
 
-def convert_brackets(sql):
-    # Convert square brackets to backticks, but not within DBT tags or config blocks
-    in_dbt = False
-    result = ""
-    i = 0
-    
-    while i < len(sql):
-        if sql[i:i+2] == '{{':
-            in_dbt = True
-            result += sql[i:i+2]
-            i += 2
-        elif sql[i:i+2] == '}}':
-            in_dbt = False
-            result += sql[i:i+2]
-            i += 2
-        elif not in_dbt and sql[i] == '[':
-            result += '`'
-            i += 1
-        elif not in_dbt and sql[i] == ']':
-            result += '`'
-            i += 1
-        else:
-            result += sql[i]
-            i += 1
-            
-    return result
+# Only the regions that matter for identifier quoting. Everything between two
+# matches is plain SQL without brackets or double quotes and is copied as-is.
+IDENTIFIER_QUOTE_PATTERN = re.compile(
+    rf"(?P<skip>{tsql_lexer.JINJA}|{tsql_lexer.COMMENT}|{tsql_lexer.STRING})"
+    rf"|(?P<quoted>{tsql_lexer.QUOTED})"
+    r'|(?P<stray>[\[\]"])',
+    re.DOTALL)
+
 
+def convert_identifier_quotes(sql, quotes=True):
+    """Convert [bracketed] and, optionally, "double quoted" identifiers to backticks.
+
+    Single scan: string literals, comments and Jinja regions are copied
+    through untouched and output goes into a list buffer.
+    """
+    result = []
+    position = 0
+    for match in IDENTIFIER_QUOTE_PATTERN.finditer(sql):
+        text = match.group()
+        if match.lastgroup == 'skip' or (not quotes and text[0] == '"'):
+            continue
+        result.append(sql[position:match.start()])
+        if match.lastgroup == 'quoted':
+            result.append('`' + text[1:-1] + '`')
+        else:
+            # Unbalanced bracket or quote
+            result.append('`')
+        position = match.end()
+    result.append(sql[position:])
+    return ''.join(result)
 
 
+def convert_brackets(sql):
+    # Convert square brackets to backticks, but not within DBT tags or config blocks
+    return convert_identifier_quotes(sql, quotes=False)
 
 
 def convert_cast(sql):
-    sql = re.sub(r'CONVERT\s*\(\s*(NVARCHAR)\s*,\s*(.+?)\s*\)', r'CAST(\2 AS STRING)', sql, flags=re.IGNORECASE)
-    sql = re.sub(r'CONVERT\s*\(\s*(\w+)\s*,\s*(.+?)\s*\)', r'CAST(\2 AS \1)', sql, flags=re.IGNORECASE)
-    return sql
+    # CONVERT(type, expression) to CAST and HASHBYTES to sha2/md5/..., parsed so nested calls work
+    return apply_rule_group(sql, 'convert_cast')
 
 
 def convert_isnull(sql):
-     # Convert all ISNULL() functions to COALESCE()
-    sql = re.sub(r'ISNULL\s*\(', 'COALESCE(', sql, flags=re.IGNORECASE)
-    return sql
+    # Convert all ISNULL() functions to COALESCE()
+    return apply_token_rules(sql, _keyword_rules('isnull'))
 
 
 def convert_numeric(sql):
-     # Convert all ISNULL() functions to COALESCE()
-    sql = re.sub(r'NUMERIC\s*\(', 'DECIMAL(', sql, flags=re.IGNORECASE)
-    return sql
+    # Convert all NUMERIC() types to DECIMAL()
+    return apply_token_rules(sql, _keyword_rules('numeric'))
+
 
-def convert_hash_functions(sql):
-    # Update the hash function mapping
-    hash_func_map = {
-        'SHA2_256': 'sha2',
-        'SHA2_512': 'sha512',
-        'MD5': 'md5',
-        'SHA1': 'sha1'
-    }
-    
-    # Handle HASHBYTES with CONVERT
-    pattern = r'CONVERT\s*\(\s*BINARY\s*\(\s*\d+\s*\)\s*,\s*HASHBYTES\s*\(\s*\'([^\']+)\'\s*,\s*([^)]+)\)\s*\)'
-    sql = re.sub(pattern, 
-                lambda m: f'CAST({hash_func_map[m.group(1).strip().upper()]}({m.group(2)}) AS BINARY)',
-                sql, 
-                flags=re.IGNORECASE)
-    
-    # Handle regular HASHBYTES
-    pattern = r'HASHBYTES\s*\(\s*\'([^\']+)\'\s*,\s*([^)]+)\)'
-    sql = re.sub(pattern, 
-                lambda m: f'{hash_func_map[m.group(1).strip().upper()]}({m.group(2)})',
-                sql, 
-                flags=re.IGNORECASE)
-    
-    return sql
 
 
 
+JINJA_IF_PATTERN = re.compile(r'{% if(.+?)%}', re.IGNORECASE)
+
 
 def process_unconverted(parsed):
+    """Comment out statements sqlparse cannot classify, takes SQL text or parsed statements"""
+    if isinstance(parsed, str):
+        # sqlparse is slow to import and only needed here, keep it off the startup path
+        import sqlparse
+        parsed = sqlparse.parse(parsed)
     new_parsed = []
     for stmt in parsed:
         if stmt.get_type() in ('UNKNOWN', 'DDL'):
             stmt_str = str(stmt)
-            if re.search(r'{% if(.+?)%}', stmt_str, flags=re.IGNORECASE):
+            if JINJA_IF_PATTERN.search(stmt_str):
                 new_parsed.append(f'{stmt_str}\n')
             else:
                 new_parsed.append(f'-- Unable to convert:\n-- {stmt_str}\n')
@@ -298,236 +199,651 @@ def process_unconverted(parsed):
     return new_parsed
 
 
-def move_alias_in_case_statements(content):
-    def replace_case_alias(match):
-        alias = match.group(1)
-        case_stmt = match.group(2)
-        # Clean up any incorrect AS placements
-        case_stmt = re.sub(r'THEN\s+([^\s]+)\s+AS\s+ALIAS', r'THEN \1', case_stmt)
-        return f"{case_stmt} AS {alias}"
-    
-    # Handle cases where alias is before the CASE statement
-    pattern = r'(\w+)\s*=\s*(CASE\b.*?END)'
-    content = re.sub(pattern, replace_case_alias, content, flags=re.DOTALL | re.IGNORECASE)
-    
-    return content
-
-def fix_join_conditions(content):
-    def fix_condition(match):
-        condition = match.group(0)
-        # Remove incorrect AS clauses in join conditions
-        condition = re.sub(r'(\w+\.\w+)\s+AS\s+(\w+)', r'\1 = \2', condition)
-        return condition
-    
-    pattern = r'ON\s+.*?(?=(JOIN|\s*$))'
-    content = re.sub(pattern, fix_condition, content, flags=re.DOTALL | re.IGNORECASE)
-    return content
-
 def fix_backticks(content):
-    """Ensure consistent backtick usage while preserving Jinja and handling SQL within Jinja blocks"""
-    
-    def process_jinja_sql(match):
-        """Process SQL within Jinja blocks separately"""
-        jinja_content = match.group(0)
-        
-        # Extract SQL part from Jinja
-        sql_match = re.search(r'SELECT.*?(?={%-?\s*end)', jinja_content, re.DOTALL | re.IGNORECASE)
-        if sql_match:
-            sql_part = sql_match.group(0)
-            # Process SQL normally
-            processed_sql = fix_sql_identifiers(sql_part)
-            # Replace original SQL with processed version
-            return jinja_content.replace(sql_part, processed_sql)
-        return jinja_content
-    
-    def fix_sql_identifiers(sql):
-        """Fix backticks for SQL identifiers only"""
-        # SQL keywords that should not be backticked
-        keywords = set(['SELECT', 'FROM', 'WHERE', 'AND', 'OR', 'AS', 'IN', 'ON', 'JOIN'])
-        
-        def replace_identifier(match):
-            word = match.group(0)
-            if word.upper() in keywords:
-                return word
-            return word  # Don't add backticks within Jinja SQL
-            
-        return re.sub(r'\b[A-Za-z_][A-Za-z0-9_.]*\b', replace_identifier, sql)
-    
-    # Process Jinja blocks first
-    content = re.sub(r'\{%-?\s*call.*?endcall\s*-?%\}', process_jinja_sql, content, flags=re.DOTALL)
-    
-    # Process remaining SQL normally
-    # ... rest of the backtick processing for non-Jinja SQL ...
-    
+    """Kept for callers, rules never see Jinja (see run_transforms) so there is nothing left to fix"""
     return content
 
 def cleanup_unconverted_equals(sql):
     """Second pass to clean up any remaining equals that should be AS"""
-    
-    patterns = [
-        # Handle table.column = alias pattern
-        (r',\s*(`[^`]+`\.`[^`]+`)\s*=\s*(`[^`]+`)', r',\1 AS \2'),
-        
-        # Handle remaining equals with backticks
-        (r',\s*(`[^`]+`)\s*=\s*(`[^`]+`)', r',\1 AS \2'),
-        
-        # Handle any remaining equals between identifiers
-        (r',\s*([A-Za-z_][A-Za-z0-9_]*(?:\.[A-Za-z_][A-Za-z0-9_]*)?)\s*=\s*([A-Za-z_][A-Za-z0-9_]*)', r',\1 AS \2'),
-        
-        # Handle function calls with equals
-        (r',\s*(UPPER|LOWER|TRIM|CAST|CONVERT|COALESCE|LEFT|RIGHT)\s*\([^)]+\)\s*=\s*([A-Za-z_][A-Za-z0-9_]*)', r',\1 AS \2'),
-        
-        # Handle reverse order (alias = expression)
-        (r',\s*([A-Za-z_][A-Za-z0-9_]*)\s*=\s*([A-Za-z_][A-Za-z0-9_]*(?:\.[A-Za-z_][A-Za-z0-9_]*)?)', r',\2 AS \1')
-    ]
-    
-    for pattern, replacement in patterns:
-        sql = re.sub(pattern, replacement, sql, flags=re.DOTALL | re.IGNORECASE)
-    
-    return sql
+    return apply_rule_group(sql, 'cleanup_unconverted_equals')
 
 def fix_column_aliases(content):
     """Fix column alias syntax for complex expressions"""
-    
-    def handle_complex_expression(match):
-        full_expr = match.group(0)
-        alias = match.group(1)
-        expression = match.group(2)
-        
-        # Remove the alias from the start
-        # Add it to the end of the expression
-        return f',{expression} AS {alias}'
-    
-    # Pattern for complex expressions with alias at start
-    complex_pattern = r',\s*([A-Za-z_][A-Za-z0-9_]*)\s*=\s*((?:FLOOR|CEILING|ROUND|ABS)\s*\([^)]*(?:\([^)]*\)[^)]*)*\))'
-    
-    content = re.sub(complex_pattern, handle_complex_expression, content, flags=re.DOTALL | re.IGNORECASE)
-    
-    return content
+    # The SELECT list parser places the alias after FLOOR/CEILING/ROUND/ABS expressions too
+    return convert_equal_alias_to_as(content)
 
 def convert_brackets_and_quotes(sql):
-    # First convert square brackets to temporary marker
-    sql = re.sub(r'\[([^\]]+)\]', r'__TEMP_BRACKET__\1__TEMP_BRACKET__', sql)
-    
-    # Convert double quotes to temporary marker (but not within DBT tags)
-    in_dbt = False
-    result = ""
-    i = 0
-    
-    while i < len(sql):
-        if sql[i:i+2] == '{{':
-            in_dbt = True
-            result += sql[i:i+2]
-            i += 2
-        elif sql[i:i+2] == '}}':
-            in_dbt = False
-            result += sql[i:i+2]
-            i += 2
-        elif not in_dbt and sql[i] == '"':
-            result += '__TEMP_QUOTE__'
-            i += 1
+    # Square brackets and double quotes both become backticks
+    return convert_identifier_quotes(sql, quotes=True)
+
+# The conversion pipeline, in order. The keyword rules (concatenation, NOLOCK,
+# ISNULL, NUMERIC, TINYINT, GETDATE, SYSDATETIME) share one pass.
+TRANSFORMS = [
+    apply_keyword_rules,
+    convert_equal_alias_to_as,
+    convert_brackets_and_quotes,
+    convert_window_functions,
+    convert_cast,
+    convert_data_types,
+    # Cleanup pass
+    cleanup_unconverted_equals,
+]
+
+# Triggers of the transforms that aren't rule groups (see tsql_rules.rule_triggers)
+TRANSFORM_TRIGGERS = {
+    convert_brackets_and_quotes: ('[', ']', '"'),
+}
+_TRANSFORM_TRIGGER_WORDS = tuple(sorted({trigger for triggers in TRANSFORM_TRIGGERS.values()
+                                         for trigger in triggers}))
+
+# Statements converted together per step in streaming mode, in characters.
+# Per-statement conversion would pay the fixed cost of every rule per statement.
+STREAM_BATCH_SIZE = 256 * 1024
+
+# Smallest piece of a script converted by one worker with convert_sql_parallel,
+# in characters. Scripts under twice this size are converted serially.
+PARALLEL_CHUNK_SIZE = 256 * 1024
+
+# dbt_config: rewrite the {{ config(...) }} block to the supported parameters
+# disabled_rules: rule names to skip for this call only (see tsql_rules.list_rules)
+# lowercase: lowercase the output, saves a separate lowercase_all.py pass over the files.
+#            'code' (or True) leaves strings, comments and Jinja alone, 'all' lowercases everything
+ConversionOptions = namedtuple('ConversionOptions', ['dbt_config', 'disabled_rules', 'lowercase'],
+                               defaults=[True, (), None])
+
+# sql: the converted SQL, with the rewritten dbt config block on top if there was one
+# dbt_config: the rewritten config block, None if the input had none
+# skipped_rules: rules that exceeded their time budget and left the SQL unchanged
+# diagnostics: human readable warnings about the conversion
+# applied_rules: rules that changed the SQL, in the order they first did
+# untriggered_rules: rule runs skipped because none of the rule's trigger words were in the SQL
+ConversionResult = namedtuple('ConversionResult',
+                              ['sql', 'dbt_config', 'skipped_rules', 'diagnostics', 'applied_rules',
+                               'untriggered_rules'])
+
+
+def run_transforms(sql):
+    """Run the pipeline on the SQL only: Jinja is masked first and put back unchanged at the end
+
+    The masked SQL is indexed for trigger words once, rules and transforms
+    none of whose triggers occur are skipped (see tsql_rules.triggers_present).
+    """
+    sql, jinja_spans = mask_jinja(sql)
+    with triggers_present(find_triggers(sql, _TRANSFORM_TRIGGER_WORDS)):
+        for transform in TRANSFORMS:
+            sql = run_transform(transform, sql, TRANSFORM_TRIGGERS.get(transform, ()))
+    return unmask_jinja(sql, jinja_spans)
+
+
+def convert_statements(sql, memo, disabled_rules, skipped_rules, applied_rules):
+    """Run the pipeline statement by statement, reusing conversions of statements seen before
+
+    Surrounding whitespace is not part of the memo key, it is kept as is.
+    Conversions that skipped a rule are not memoized.
+    """
+    converted = []
+    for statement in split_statements(sql):
+        core = statement.strip()
+        if not core:
+            converted.append(statement)
+            continue
+        start = statement.index(core)
+        key = (tuple(disabled_rules), core)
+        cached = memo.get(key)
+        if cached is None:
+            with collect_skipped_rules() as statement_skipped, collect_applied_rules() as statement_applied:
+                result = run_transforms(core)
+            skipped_rules.extend(name for name in statement_skipped if name not in skipped_rules)
+            if not statement_skipped:
+                memo.put(key, (result, tuple(statement_applied)))
         else:
-            result += sql[i]
-            i += 1
-    
-    sql = result
-    
-    # Now convert all temporary markers to backticks
-    sql = sql.replace('__TEMP_BRACKET__', '`')
-    sql = sql.replace('__TEMP_QUOTE__', '`')
-    
-    return sql
+            result, statement_applied = cached
+            applied_rules.extend(name for name in statement_applied if name not in applied_rules)
+        converted.append(statement[:start] + result + statement[start + len(core):])
+    return ''.join(converted)
 
-def convert_tsql_to_databricks(file_path, output_path):
-    with open(file_path, 'r') as file:
-        content = file.read()
 
-    # Add headers
-    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    header = f'-- Converted on: {now}\n'
-    header += f'-- Command: python {" ".join(sys.argv)}\n\n'
-    
+def convert_sql(sql, options=None, memo=None):
+    """Convert TSQL text to Databricks SQL in memory and return a ConversionResult
+
+    No files are read or written and nothing is printed, the file entry
+    points below are thin wrappers around this.
+
+    With a memo (see conversion_memo.ConversionMemo) statements are converted
+    one by one and repeated statements are taken from the memo. Like in
+    streaming mode, rules then cannot see across statements.
+    """
+    options = options or ConversionOptions()
+    dbt_config = None
     # First handle DBT config separately
-    dbt_header_match = is_dbt_model(content)
+    dbt_header_match = is_dbt_model(sql) if options.dbt_config else None
     if dbt_header_match:
         dbt_config = update_dbt_config(dbt_header_match)
         # Remove the original config block
-        content = re.sub(re.escape(dbt_header_match.group(0)), '', content, count=1)
-    
+        sql = sql.replace(dbt_header_match.group(0), '', 1)
+
     # Apply transformations in correct order
-    content = convert_concatenation(content)
-    content = convert_equal_alias_to_as(content)
-    content = convert_brackets_and_quotes(content)
-    content = move_alias_in_case_statements(content)
-    content = fix_join_conditions(content)
-    content = convert_window_functions(content)
-    content = convert_dbt_vars(content)
-    content = convert_cast(content)
-    content = convert_hash_functions(content)
-    content = remove_nolock_hint(content)
-    content = convert_data_types(content)
-    content = convert_brackets(content)
-    content = convert_isnull(content)
-    content = convert_numeric(content)
-    content = fix_backticks(content)
-    
-    # Add cleanup pass
-    content = cleanup_unconverted_equals(content)
-    
+    with rules_disabled(options.disabled_rules), collect_skipped_rules() as skipped_rules, \
+            collect_applied_rules() as applied_rules, collect_untriggered_rules() as untriggered_rules:
+        if memo is None:
+            sql = run_transforms(sql)
+        else:
+            sql = convert_statements(sql, memo, options.disabled_rules, skipped_rules, applied_rules)
+
     # Add back the DBT config at the start if it existed
+    if dbt_config is not None:
+        sql = dbt_config + '\n\n' + sql
+
+    if options.lowercase:
+        sql = lowercase_sql(sql, 'code' if options.lowercase is True else options.lowercase)
+
+    diagnostics = [f"rule {rule_name} exceeded its time budget and was skipped" for rule_name in skipped_rules]
+    return ConversionResult(sql, dbt_config, skipped_rules, diagnostics, applied_rules,
+                            sum(untriggered_rules.values()))
+
+# Whitespace and the character after it
+NEXT_CHARACTER_PATTERN = re.compile(r'\s*(\S?)')
+
+
+def iter_script_chunks(sql, chunk_size):
+    """Split sql at statement boundaries into pieces of at least chunk_size characters
+
+    A GO line followed by + or = is not cut after, operator rules strip the
+    whitespace around those and would see across it.
+    """
+    start = 0
+    for end in iter_statement_ends(sql):
+        if end - start >= chunk_size and NEXT_CHARACTER_PATTERN.match(sql, end).group(1) not in ('+', '='):
+            yield sql[start:end]
+            start = end
+    if start < len(sql):
+        yield sql[start:]
+
+
+def is_self_contained(chunk):
+    """Whether no rule can see past the end of chunk, so converting it alone gives the same result
+
+    Statements never share a match once every parenthesis in code is closed
+    (the parsers pair them up) and no raw ( or ` is left open at the end
+    (cleanup rules match up to the next ) or `, even in strings and comments).
+    """
+    return not open_parens(chunk) and chunk.rfind('(') <= chunk.rfind(')') and chunk.count('`') % 2 == 0
+
+
+def convert_chunk(chunk, options, whole=False):
+    """Convert one chunk of a script in a worker process, see convert_sql_parallel
+
+    Returns (ConversionResult, untriggered rule counts), or None if the chunk
+    is not self-contained. whole=True converts a whole script, self-contained
+    or not.
+    """
+    if not whole and not is_self_contained(chunk):
+        return None
+    with collect_untriggered_rules() as untriggered_rules:
+        result = convert_sql(chunk, options)
+    return result, untriggered_rules
+
+
+def configure_rules(disabled_rules=(), rule_timeout=tsql_rules.RULE_TIME_BUDGET):
+    """Disable rules by name and set the per-rule time budget, also used as the process pool initializer"""
+    for name in disabled_rules:
+        disable_rule(name)
+    set_rule_time_budget(rule_timeout)
+
+
+def _in_rule_order(names):
+    order = {rule.name: index for index, rule in enumerate(list_rules())}
+    return sorted(names, key=order.get)
+
+
+def convert_sql_parallel(sql, options=None, jobs=None, executor=None):
+    """convert_sql for a large script, with the statements split over worker processes
+
+    The script is cut at statement boundaries into about four chunks per
+    worker, converted in jobs processes (one per CPU by default) or in the
+    given executor of jobs workers, and reassembled in order. The dbt config
+    block is taken out and rewritten once, here, like convert_sql does.
+    Rules only ever match within a statement, so the result is the one
+    convert_sql gives; in the rare script where a statement leaves a
+    parenthesis open (see is_self_contained) the whole script is converted
+    serially instead, in one of the executor's workers if there is one.
+
+    Rule time budgets then apply per chunk, and untriggered_rules counts
+    the rule runs skipped per chunk.
+    """
+    options = options or ConversionOptions()
+    jobs = jobs or os.cpu_count() or 1
+    original_sql = sql
+    dbt_config = None
+    dbt_header_match = is_dbt_model(sql) if options.dbt_config else None
     if dbt_header_match:
-        content = dbt_config + '\n\n' + content
+        dbt_config = update_dbt_config(dbt_header_match)
+        sql = sql.replace(dbt_header_match.group(0), '', 1)
+
+    def convert_whole():
+        if executor is None:
+            return convert_sql(original_sql, options)
+        # In a worker, where the rule time budget applies even if this runs in a thread
+        result, untriggered_rules = executor.submit(convert_chunk, original_sql, options, True).result()
+        merge_rule_results(result.applied_rules, untriggered_rules)
+        return result
+
+    chunks = list(iter_script_chunks(sql, max(PARALLEL_CHUNK_SIZE, len(sql) // (jobs * 4))))
+    if len(chunks) <= 1 or (executor is None and jobs <= 1):
+        return convert_whole()
+    chunk_options = [options._replace(dbt_config=False)] * len(chunks)
+    if executor is not None:
+        converted = list(executor.map(convert_chunk, chunks, chunk_options))
+    else:
+        # Imported here, multiprocessing adds noticeably to the startup of the converter CLI
+        from concurrent.futures import ProcessPoolExecutor
+        disabled_rules = [rule.name for rule in list_rules() if not rule.enabled]
+        with ProcessPoolExecutor(max_workers=min(jobs, len(chunks)), initializer=configure_rules,
+                                 initargs=(disabled_rules, tsql_rules.RULE_TIME_BUDGET)) as pool:
+            converted = list(pool.map(convert_chunk, chunks, chunk_options))
+    if any(chunk is None for chunk in converted):
+        return convert_whole()
+
+    parts = []
+    skipped_rules = []
+    applied_rules = []
+    untriggered_rules = Counter()
+    for result, chunk_untriggered in converted:
+        parts.append(result.sql)
+        skipped_rules.extend(name for name in result.skipped_rules if name not in skipped_rules)
+        applied_rules.extend(name for name in result.applied_rules if name not in applied_rules)
+        untriggered_rules.update(chunk_untriggered)
+    # Rules run in registry order, serially they are collected in that order too
+    skipped_rules = _in_rule_order(skipped_rules)
+    applied_rules = _in_rule_order(applied_rules)
+    merge_rule_results(applied_rules, untriggered_rules)
+
+    sql = ''.join(parts)
+    if dbt_config is not None:
+        header = dbt_config + '\n\n'
+        if options.lowercase:
+            header = lowercase_sql(header, 'code' if options.lowercase is True else options.lowercase)
+        sql = header + sql
+    diagnostics = [f"rule {rule_name} exceeded its time budget and was skipped" for rule_name in skipped_rules]
+    return ConversionResult(sql, dbt_config, skipped_rules, diagnostics, applied_rules,
+                            sum(untriggered_rules.values()))
+
+def conversion_header():
+    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    header = f'-- Converted on: {now}\n'
+    header += f'-- Command: python {" ".join(sys.argv)}\n\n'
+    return header
+
+def warn_skipped_rules(skipped_rules, file_path, file=None):
+    # Rules that hit their time budget left the content as it was, flag them for review
+    for rule_name in skipped_rules:
+        print(f"Warning: rule {rule_name} exceeded its time budget on {file_path} and was skipped", file=file)
+    if skipped_rules:
+        return f'-- Skipped rules (time budget exceeded): {", ".join(skipped_rules)}\n\n'
+    return ''
+
+def iter_statement_batches(file, batch_size=STREAM_BATCH_SIZE):
+    """Group consecutive statements into batches of roughly batch_size characters"""
+    batch = []
+    size = 0
+    for statement in iter_statements(file):
+        batch.append(statement)
+        size += len(statement)
+        if size >= batch_size:
+            yield ''.join(batch)
+            batch = []
+            size = 0
+    if batch:
+        yield ''.join(batch)
+
+def iter_batch_offsets(data, batch_size=STREAM_BATCH_SIZE):
+    """Like iter_statement_batches on bytes-like data, yields (start, end) offsets instead of text"""
+    start = 0
+    for end in iter_statement_ends(data):
+        if end - start >= batch_size:
+            yield start, end
+            start = end
+    if start < len(data):
+        yield start, len(data)
+
+# Bytes some transform could act on: every rule and transform trigger, plus
+# the dbt config block. A batch without any of them converts to itself,
+# unless it needs \r\n translation like text mode reads do.
+CONVERSION_TRIGGERS = re.compile(
+    b'|'.join(re.escape(trigger.encode('utf-8'))
+              for trigger in all_triggers() + _TRANSFORM_TRIGGER_WORDS + ('config', '\r')),
+    re.IGNORECASE)
+
+def convert_mapped_file(data, output_file, batch_size=STREAM_BATCH_SIZE, options=None, memo=None):
+    """Convert a memory-mapped UTF-8 file batch by batch to the binary output_file, returns the skipped rules
+
+    Statement boundaries and the CONVERSION_TRIGGERS check run on the
+    mapped bytes. Batches with no trigger are written straight from the
+    map, without decoding or copying (nor validating them as UTF-8). Only
+    the other batches are decoded and converted, so memory stays bounded
+    by the batch size whatever the file size.
+    """
+    options = options or ConversionOptions()
+    skipped_rules = []
+    with memoryview(data) as view:
+        for start, end in iter_batch_offsets(data, batch_size):
+            if not options.lowercase and not CONVERSION_TRIGGERS.search(data, start, end):
+                output_file.write(view[start:end])
+                continue
+            # Universal newlines, as when reading the file in text mode
+            batch = str(view[start:end], 'utf-8').replace('\r\n', '\n').replace('\r', '\n')
+            result = convert_sql(batch, options, memo)
+            output_file.write(result.sql.encode('utf-8'))
+            skipped_rules.extend(name for name in result.skipped_rules if name not in skipped_rules)
+    return skipped_rules
+
+def convert_tsql_to_databricks_streaming(file_path, output_path, batch_size=STREAM_BATCH_SIZE, options=None,
+                                         memo=None):
+    """Convert a large script statement by statement, writing output as it goes
+
+    Statements are split on ';' and GO outside strings, comments and Jinja
+    blocks and converted in batches of about batch_size characters, so peak
+    memory is bounded by the batch size or the largest single statement.
+    Rules cannot see across batches in this mode.
+
+    Regular files are memory-mapped (see convert_mapped_file), anything
+    else, e.g. an empty file or a pipe, is read as text in chunks.
+    """
+    if os.path.isfile(file_path) and os.path.getsize(file_path) > 0:
+        with open(file_path, 'rb') as file, open(output_path, 'wb') as output_file, \
+                mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            output_file.write(conversion_header().encode('utf-8'))
+            skipped_rules = convert_mapped_file(data, output_file, batch_size, options, memo)
+            output_file.write(warn_skipped_rules(skipped_rules, file_path).encode('utf-8'))
+        return skipped_rules
+
+    skipped_rules = []
+    with open(file_path, 'r') as file, open(output_path, 'w') as output_file:
+        output_file.write(conversion_header())
+        for batch in iter_statement_batches(file, batch_size):
+            result = convert_sql(batch, options, memo)
+            output_file.write(result.sql)
+            skipped_rules.extend(name for name in result.skipped_rules if name not in skipped_rules)
+        # The header is already written, so skipped rules are noted at the end
+        output_file.write(warn_skipped_rules(skipped_rules, file_path))
+    return skipped_rules
+
+def converted_file_text(content, file_path, options=None, memo=None, jobs=1, executor=None, output=None):
+    """Header and converted SQL as written to an output file, returns (text, skipped rule names)
+
+    With jobs > 1 or an executor, large contents are converted with
+    convert_sql_parallel, unless statements are memoized. jobs is then the
+    number of workers of the executor. Warnings go to output, stdout by
+    default.
+    """
+    header = conversion_header()
+    if memo is None and (jobs > 1 or executor is not None):
+        result = convert_sql_parallel(content, options, jobs, executor)
+    else:
+        result = convert_sql(content, options, memo)
+    header += warn_skipped_rules(result.skipped_rules, file_path, output)
+    return header + result.sql, result.skipped_rules
+
+def convert_tsql_to_databricks(file_path, output_path, stream=False, options=None, memo=None, jobs=1):
+    """Convert one file, see convert_sql for the options and memo. Returns the skipped rule names
+
+    With jobs > 1 a large script is converted in that many processes, see
+    convert_sql_parallel (not in streaming mode).
+    """
+    if stream:
+        return convert_tsql_to_databricks_streaming(file_path, output_path, options=options, memo=memo)
+
+    with open(file_path, 'r') as file:
+        content = file.read()
+
+    text, skipped_rules = converted_file_text(content, file_path, options, memo, jobs)
 
     # Write the converted content
     with open(output_path, 'w') as output_file:
-        output_file.write(header + content)
+        output_file.write(text)
+
+    return skipped_rules
+
+def iter_path_list(stream, chunk_size=64 * 1024):
+    """Yield (path, text) for each .sql path in a NUL separated list read from a binary stream
+
+    Paths that no longer exist (e.g. deleted files in a git diff) are reported
+    on stderr and skipped. A file that cannot be read or decoded is yielded
+    with the error in place of its text, so convert_batch counts it as failed.
+    """
+    def read(paths):
+        for path in paths:
+            path = os.fsdecode(path.strip(b'\n'))
+            if not path.lower().endswith('.sql'):
+                continue
+            if not os.path.isfile(path):
+                print(f"Skipping {path}: not a file", file=sys.stderr)
+                continue
+            try:
+                with open(path, 'r') as file:
+                    text = file.read()
+            except (OSError, UnicodeDecodeError) as e:
+                text = e
+            yield path, text
+
+    buffer = b''
+    for chunk in iter(lambda: stream.read(chunk_size), b''):
+        buffer += chunk
+        *paths, buffer = buffer.split(b'\0')
+        yield from read(paths)
+    yield from read([buffer])
+
+
+def iter_tar_files(stream):
+    """Yield (path, text) for each .sql file in a tar archive read from a binary stream
+
+    A member that is not valid UTF-8 is yielded with the error in place of its text.
+    """
+    # tarfile is only needed in batch mode, keep it off the startup path
+    import tarfile
+    with tarfile.open(fileobj=stream, mode='r|*') as archive:
+        for member in archive:
+            if member.isfile() and member.name.lower().endswith('.sql'):
+                data = archive.extractfile(member).read()
+                try:
+                    text = data.decode('utf-8')
+                except UnicodeDecodeError as e:
+                    text = e
+                yield member.name, text
+
+
+def batch_relative_path(path):
+    """The path a batch input is written under, relative to the output directory or archive root
+
+    Raises ValueError for a path that would end up outside it.
+    """
+    relative = os.path.normpath(os.path.splitdrive(path)[1]).lstrip(os.sep)
+    if relative == '..' or relative.startswith('..' + os.sep):
+        raise ValueError(f"Path escapes the output directory: {path}")
+    return relative
+
+
+def batch_output_path(output_dir, path):
+    """Where a batch input ends up in output_dir, always inside it"""
+    return os.path.join(output_dir, batch_relative_path(path))
+
+
+def convert_batch(sources, output_dir=None, output=None, options=None):
+    """Convert (path, text) pairs in this process
+
+    text may be the exception raised reading the file, which then counts as
+    failed like a conversion error. Results are written under output_dir, keeping their relative paths, or
+    as a tar archive to the binary stream output. Log lines go to stderr so
+    the archive can be piped. Returns the number of files that failed.
+    """
+    archive = None
+    if output_dir is None:
+        import tarfile
+        archive = tarfile.open(fileobj=output, mode='w|')
+
+    failed = 0
+    try:
+        for path, text in sources:
+            try:
+                if isinstance(text, Exception):
+                    raise text
+                result = convert_sql(text, options)
+                content = conversion_header() + warn_skipped_rules(result.skipped_rules, path, sys.stderr)
+                content += result.sql
+                if archive is None:
+                    output_path = batch_output_path(output_dir, path)
+                    os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+                    with open(output_path, 'w') as output_file:
+                        output_file.write(content)
+                else:
+                    data = content.encode('utf-8')
+                    info = tarfile.TarInfo(batch_relative_path(path).replace(os.sep, '/'))
+                    info.size = len(data)
+                    info.mtime = int(datetime.now().timestamp())
+                    archive.addfile(info, io.BytesIO(data))
+                print(f"Converted {path}", file=sys.stderr)
+            except Exception as e:
+                failed += 1
+                print(f"Error converting {path}: {type(e).__name__}: {e}", file=sys.stderr)
+    finally:
+        if archive is not None:
+            archive.close()
+    return failed
+
+def _new_record(input_path, output_path):
+    return {
+        'file': input_path,
+        'output': output_path,
+        'status': 'converted',
+        'seconds': 0.0,
+        'input_bytes': None,
+        'output_bytes': None,
+        'rules_applied': [],
+        'skipped_rules': [],
+        'untriggered_rules': 0,
+        'error': None
+    }
 
-def process_sql_file(input_path, output_path):
-    """Process a single SQL file with proper error handling"""
+def _record_error(record, error, log, trace_in_output):
+    """Log a conversion error and note it in the record, returns the commented note for the output file"""
+    input_path = record['file']
+    log(f"Error converting {input_path}")
+    log(f"Error details: {str(error)}")
+    log(f"Error type: {type(error)}")
+    import traceback
+    trace = traceback.format_exc()
+    record['status'] = 'error'
+    record['error'] = {'type': type(error).__name__, 'message': str(error), 'traceback': trace}
+    formatted_trace = trace.replace('\n', '\n-- ')
+    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    note = f'-- Error during conversion on: {now}\n'
+    note += f'-- Error: {str(error)}\n'
+    if trace_in_output:
+        note += f'-- Stack trace:\n-- {formatted_trace}\n'
+    note += f'-- Original file: {input_path}\n'
+    return note
+
+def process_sql_file(input_path, output_path, stream=False, options=None, quiet=False, trace_in_output=True,
+                     memo=None):
+    """Convert one file with proper error handling, returns a run report record
+
+    The record is a dict with file, output, status ('converted', 'partial'
+    when rules were skipped, or 'error'), seconds, input_bytes,
+    output_bytes, rules_applied, skipped_rules, untriggered_rules (rule runs
+    skipped for lack of a trigger word) and error (type, message and
+    traceback, or None). On error the output gets a commented error note,
+    with the traceback unless trace_in_output is False. quiet=True prints
+    nothing.
+    """
+    log = (lambda *args: None) if quiet else print
+    start = time.perf_counter()
+    record = _new_record(input_path, output_path)
     try:
-        print(f"Reading file: {input_path}")
-        with open(input_path, 'r') as file:
-            content = file.read()
-        
-        # Order matters: formatting -> backticks
-        print("Fixing SQL formatting...")
-        content = fix_sql_formatting(content)
-        
-        print("Fixing backticks...")
-        content = fix_backticks(content)
-        
-        # Write to temporary file
-        temp_path = f"{input_path}.tmp"
-        print(f"Writing temp file: {temp_path}")
-        with open(temp_path, 'w') as temp:
-            temp.write(content)
-            
-        print("Converting using main script...")
-        convert_tsql_to_databricks(temp_path, output_path)
-        
-        # Clean up temp file
-        os.remove(temp_path)
-        print(f"Successfully converted {input_path}")
+        log(f"Processing: {input_path}")
+        record['input_bytes'] = os.path.getsize(input_path)
+        with collect_applied_rules() as applied_rules, collect_untriggered_rules() as untriggered_rules:
+            skipped_rules = convert_tsql_to_databricks(input_path, output_path, stream=stream, options=options,
+                                                       memo=memo)
+        record['rules_applied'] = applied_rules
+        record['untriggered_rules'] = sum(untriggered_rules.values())
+        record['skipped_rules'] = skipped_rules
+        if skipped_rules:
+            record['status'] = 'partial'
+        log(f"Successfully converted {input_path}")
     except Exception as e:
-        print(f"Error converting {input_path}")
-        print(f"Error details: {str(e)}")
-        print(f"Error type: {type(e)}")
-        import traceback
-        trace = traceback.format_exc()
-        formatted_trace = trace.replace('\n', '\n-- ')
+        note = _record_error(record, e, log, trace_in_output)
         with open(output_path, 'w') as f:
-            now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            f.write(f'-- Error during conversion on: {now}\n')
-            f.write(f'-- Error: {str(e)}\n')
-            f.write(f'-- Stack trace:\n-- {formatted_trace}\n')
-            f.write(f'-- Original file: {input_path}\n')
+            f.write(note)
+    record['seconds'] = time.perf_counter() - start
+    if os.path.exists(output_path):
+        record['output_bytes'] = os.path.getsize(output_path)
+    return record
+
+def convert_file_content(content, input_path, output_path, options=None, quiet=False, trace_in_output=True,
+                         memo=None, executor=None, jobs=1, output=None):
+    """process_sql_file for content the caller has already read, returns (record, text for output_path)
+
+    Nothing is read or written, so the caller can overlap file I/O with
+    conversions (see conversion_pipeline). output_bytes is left for the
+    caller to fill in once the text is written. With an executor the
+    content is split over its jobs workers, see convert_sql_parallel.
+    Console lines go to output, stdout by default.
+    """
+    log = (lambda *args: None) if quiet else functools.partial(print, file=output)
+    start = time.perf_counter()
+    record = _new_record(input_path, output_path)
+    record['input_bytes'] = len(content.encode('utf-8'))
+    try:
+        log(f"Processing: {input_path}")
+        with collect_applied_rules() as applied_rules, collect_untriggered_rules() as untriggered_rules:
+            text, skipped_rules = converted_file_text(content, input_path, options, memo, jobs, executor, output)
+        record['rules_applied'] = applied_rules
+        record['untriggered_rules'] = sum(untriggered_rules.values())
+        record['skipped_rules'] = skipped_rules
+        if skipped_rules:
+            record['status'] = 'partial'
+        log(f"Successfully converted {input_path}")
+    except Exception as e:
+        text = _record_error(record, e, log, trace_in_output)
+    record['seconds'] = time.perf_counter() - start
+    return record, text
 
 if __name__ == '__main__':
-    if len(sys.argv) < 3:
-        print("Usage: python3 tsql_to_databricks.py input_file.sql output_file.sql")
+    if len(sys.argv) < 2:
+        print("Usage: python3 tsql_to_databricks.py input_file.sql output_file.sql [--stream | --jobs N]\n"
+              "       python3 tsql_to_databricks.py --batch [--tar] [--output-dir DIR] < paths")
         sys.exit(1)
-    
-    input_file = sys.argv[1]
-    output_file = sys.argv[2]
 
-    convert_tsql_to_databricks(input_file, output_file)
+    parser = argparse.ArgumentParser(description="Convert a TSQL dbt/sql model to Databricks ANSI SQL")
+    parser.add_argument('input_file', nargs='?')
+    parser.add_argument('output_file', nargs='?')
+    parser.add_argument('--stream', action='store_true',
+                        help="convert statement by statement with bounded memory, for very large scripts")
+    parser.add_argument('--lowercase', nargs='?', const='code', choices=LOWERCASE_MODES,
+                        help="lowercase the converted SQL, 'code' (default) keeps strings, comments and "
+                             "Jinja as they are, 'all' lowercases everything")
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help="split a large script at statement boundaries and convert it in this many "
+                             "processes (0 = one per CPU, default: 1), the output is the same")
+    parser.add_argument('--batch', action='store_true',
+                        help="convert many files in one process: read a NUL separated list of paths "
+                             "(e.g. git diff --name-only -z) from stdin, or a tar archive with --tar")
+    parser.add_argument('--tar', action='store_true', help="with --batch, read a tar archive from stdin")
+    parser.add_argument('--output-dir', metavar='DIR',
+                        help="with --batch, write results under DIR instead of a tar archive on stdout")
+    args = parser.parse_args()
+    options = ConversionOptions(lowercase=args.lowercase)
+
+    if args.batch:
+        if args.input_file or args.output_file or args.stream:
+            parser.error("--batch reads its inputs from stdin and takes no file arguments or --stream")
+        sources = iter_tar_files(sys.stdin.buffer) if args.tar else iter_path_list(sys.stdin.buffer)
+        failed = convert_batch(sources, args.output_dir, sys.stdout.buffer, options)
+        sys.exit(1 if failed else 0)
+
+    if not args.input_file or not args.output_file:
+        parser.error("input_file and output_file are required")
+    if args.stream and args.jobs != 1:
+        parser.error("--jobs does not apply to --stream")
+    convert_tsql_to_databricks(args.input_file, args.output_file, stream=args.stream, options=options,
+                               jobs=args.jobs if args.jobs > 0 else (os.cpu_count() or 1))
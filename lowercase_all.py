@@ -1,86 +1,149 @@
+import argparse
 import os
-import sys
+import shutil
+import tempfile
 from collections import defaultdict
+from tsql_lexer import lowercase_code
 
-def preview_sql_files(directory='output'):
-    # Store files by directory for organized display
+__all__ = [
+    'LOWERCASE_MODES',
+    'lowercase_sql',
+    'find_sql_files',
+    'preview_sql_files',
+    'lowercase_file',
+    'lowercase_sql_files'
+]
+
+# 'code' lowercases keywords and identifiers only, 'all' lowercases everything
+# including string literals, comments and Jinja variable names
+LOWERCASE_MODES = ('code', 'all')
+
+def lowercase_sql(content, mode='code'):
+    """The lowercasing applied to file contents, also used inline by the converter"""
+    if mode == 'all':
+        return content.lower()
+    if mode != 'code':
+        raise ValueError(f"Unknown lowercase mode: {mode}")
+    return lowercase_code(content)
+
+def find_sql_files(directory='output'):
+    """Walk directory once and return {folder: [sql file names]}"""
     files_by_dir = defaultdict(list)
-    total_files = 0
-    
-    # Check if directory exists
-    if not os.path.exists(directory):
-        print(f"\nError: Directory '{directory}' does not exist.")
-        return False
-    
-    # Walk through directory and all subdirectories
     for root, dirs, files in os.walk(directory):
         # Filter for SQL files
         sql_files = [f for f in files if f.endswith('.sql')]
         if sql_files:
             files_by_dir[root] = sql_files
-            total_files += len(sql_files)
-    
+    return files_by_dir
+
+def preview_sql_files(directory='output', files_by_dir=None):
+    """Show the files that will be lowercased and ask for confirmation
+
+    Returns the {folder: [sql file names]} listing when confirmed, so the
+    caller can process exactly those files without walking the tree again,
+    and None otherwise.
+    """
+    # Check if directory exists
+    if not os.path.exists(directory):
+        print(f"\nError: Directory '{directory}' does not exist.")
+        return None
+
+    if files_by_dir is None:
+        files_by_dir = find_sql_files(directory)
+    total_files = sum(len(files) for files in files_by_dir.values())
+
     if total_files == 0:
         print(f"\nNo SQL files found in '{directory}'")
-        return False
-        
+        return None
+
     # Display preview
     print("\nFiles that will be converted to lowercase:")
     print("=========================================")
-    for directory, files in files_by_dir.items():
-        print(f"\n📁 {directory}")
+    for folder, files in files_by_dir.items():
+        print(f"\n📁 {folder}")
         for file in files:
             print(f"  └─ {file}")
-    
+
     print(f"\nTotal SQL files found: {total_files}")
-    
+
     # Ask for confirmation
     response = input("\nProceed with conversion? (y/n): ").lower().strip()
-    return response == 'y'
+    return files_by_dir if response == 'y' else None
+
+def lowercase_file(file_path, mode='code'):
+    """Lowercase one file's content and name in a single write
+
+    The lowercased content goes to a temporary file next to the original,
+    which then atomically replaces the lowercase file name, so an
+    interrupted run never leaves a half written file. Returns a log line.
+    """
+    root, file = os.path.split(file_path)
+    lowercase_name = os.path.join(root, file.lower())
+    try:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            content = f.read()
+
+        fd, temp_path = tempfile.mkstemp(dir=root or '.', prefix=f'.{file}.', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(lowercase_sql(content, mode))
+            # mkstemp files are private, keep the original's permissions
+            shutil.copymode(file_path, temp_path)
+            os.replace(temp_path, lowercase_name)
+        except BaseException:
+            os.remove(temp_path)
+            raise
 
-def lowercase_sql_files(directory='output'):
+        if file_path == lowercase_name:
+            return f"✓ Converted content: {file_path}"
+        # On a case-insensitive file system the original is the file just replaced
+        if os.path.exists(file_path) and not os.path.samefile(file_path, lowercase_name):
+            os.remove(file_path)
+        return f"✓ Renamed and converted: {file_path} → {lowercase_name}"
+    except Exception as e:
+        return f"✗ Error processing {file_path}: {e}"
+
+def lowercase_sql_files(directory='output', jobs=1, confirm=True, mode='code'):
+    """Lowercase the content and name of every SQL file under directory
+
+    The tree is walked once, for the preview, and each file is read and
+    written once. With jobs > 1 files are processed in a process pool, the
+    log is still printed in file order. See lowercase_sql for the modes.
+    """
+    files_by_dir = find_sql_files(directory)
     # First preview and get confirmation
-    if not preview_sql_files(directory):
-        print("Operation cancelled.")
-        return
-    
+    if confirm:
+        files_by_dir = preview_sql_files(directory, files_by_dir)
+        if not files_by_dir:
+            print("Operation cancelled.")
+            return
+
     print("\nProcessing files...")
     print("==================")
-    
-    # Walk through directory and all subdirectories
-    for root, dirs, files in os.walk(directory):
-        # Filter for SQL files
-        sql_files = [f for f in files if f.endswith('.sql')]
-        
-        for file in sql_files:
-            # Get full file path
-            file_path = os.path.join(root, file)
-            # Get lowercase version of filename
-            lowercase_name = os.path.join(root, file.lower())
-            
-            try:
-                # Read the file content
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    content = f.read()
-                
-                # Convert content to lowercase
-                lowercase_content = content.lower()
-                
-                # Write the lowercase content back
-                with open(file_path, 'w', encoding='utf-8') as f:
-                    f.write(lowercase_content)
-                
-                # Rename the file if needed
-                if file_path != lowercase_name:
-                    os.rename(file_path, lowercase_name)
-                    print(f"✓ Renamed and converted: {file_path} → {lowercase_name}")
-                else:
-                    print(f"✓ Converted content: {file_path}")
-                    
-            except Exception as e:
-                print(f"✗ Error processing {file_path}: {e}")
+
+    file_paths = [os.path.join(root, file) for root, files in files_by_dir.items() for file in files]
+    if jobs <= 1 or len(file_paths) <= 1:
+        for file_path in file_paths:
+            print(lowercase_file(file_path, mode))
+        return
+
+    # Imported here, multiprocessing adds noticeably to the startup of the converter CLI
+    from concurrent.futures import ProcessPoolExecutor
+    chunksize = max(1, len(file_paths) // (jobs * 8))
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        for message in executor.map(lowercase_file, file_paths, [mode] * len(file_paths), chunksize=chunksize):
+            print(message)
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Lowercase the content and names of all SQL files in a folder")
     # Get directory from command line args or use default
-    directory = sys.argv[1] if len(sys.argv) > 1 else 'output'
-    lowercase_sql_files(directory)
\ No newline at end of file
+    parser.add_argument('directory', nargs='?', default='output')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help="number of worker processes (0 = one per CPU, default: 1)")
+    parser.add_argument('-y', '--yes', action='store_true', help="skip the preview and confirmation")
+    parser.add_argument('--mode', choices=LOWERCASE_MODES, default='code',
+                        help="'code' keeps strings, comments and Jinja as they are, 'all' lowercases everything "
+                             "(default: code)")
+    args = parser.parse_args()
+    jobs = args.jobs if args.jobs > 0 else (os.cpu_count() or 1)
+    lowercase_sql_files(args.directory, jobs=jobs, confirm=not args.yes, mode=args.mode)
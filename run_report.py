@@ -0,0 +1,38 @@
+import json
+
+__all__ = [
+    'write_run_report',
+    'summarize_run',
+    'print_run_summary'
+]
+
+
+def write_run_report(path, records):
+    """Write one JSON object per converted file, see convert_tsql_to_databricks.process_sql_file"""
+    with open(path, 'w') as f:
+        for record in records:
+            f.write(json.dumps(record) + '\n')
+
+
+def summarize_run(records):
+    """Count files per status and add up durations and sizes"""
+    summary = {'files': len(records), 'converted': 0, 'partial': 0, 'error': 0,
+               'seconds': 0.0, 'input_bytes': 0, 'output_bytes': 0, 'untriggered_rules': 0}
+    for record in records:
+        summary[record['status']] += 1
+        summary['seconds'] += record['seconds']
+        summary['input_bytes'] += record['input_bytes'] or 0
+        summary['output_bytes'] += record['output_bytes'] or 0
+        summary['untriggered_rules'] += record['untriggered_rules']
+    return summary
+
+
+def print_run_summary(records, elapsed):
+    summary = summarize_run(records)
+    print(f"\nConverted {summary['converted']} of {summary['files']} files in {elapsed:.1f}s "
+          f"({summary['partial']} with skipped rules, {summary['error']} failed), "
+          f"{summary['input_bytes'] / (1024 * 1024):.1f} MB in, {summary['output_bytes'] / (1024 * 1024):.1f} MB out")
+    print(f"Skipped {summary['untriggered_rules']} rule runs on SQL without their trigger words")
+    for record in records:
+        if record['status'] == 'error':
+            print(f"  Failed: {record['file']}: {record['error']['type']}: {record['error']['message']}")
@@ -0,0 +1,28 @@
+from convert_folder_tsql_to_databricks_ansi import process_directory, verify_directory
+
+
+def test_verify_directory_reports_outputs_of_deleted_inputs(tmp_path):
+    input_dir, output_dir = tmp_path / 'in', tmp_path / 'out'
+    (input_dir / 'sub').mkdir(parents=True)
+    (input_dir / 'a.sql').write_text('SELECT a = 1 FROM t')
+    (input_dir / 'sub' / 'b.sql').write_text('SELECT b = 1 FROM t')
+    process_directory(str(input_dir), str(output_dir), incremental=True, quiet=True)
+    (input_dir / 'sub' / 'b.sql').unlink()
+
+    records = verify_directory(str(input_dir), str(output_dir))
+    assert [(record['status'], record['output']) for record in records] == [
+        ('unchanged', str(output_dir / 'a.sql')),
+        ('orphaned', str(output_dir / 'sub' / 'b.sql')),
+    ]
+
+
+def test_verify_directory_uses_the_recorded_lowercase_mode(tmp_path):
+    input_dir, output_dir = tmp_path / 'in', tmp_path / 'out'
+    input_dir.mkdir()
+    (input_dir / 'Model_A.sql').write_text('SELECT A = 1 FROM T')
+    process_directory(str(input_dir), str(output_dir), incremental=True, lowercase='code', quiet=True)
+
+    records = verify_directory(str(input_dir), str(output_dir))
+    assert [(record['status'], record['output']) for record in records] == [
+        ('unchanged', str(output_dir / 'model_a.sql')),
+    ]
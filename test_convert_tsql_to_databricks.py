@@ -0,0 +1,37 @@
+import io
+import os
+import tarfile
+import pytest
+from convert_tsql_to_databricks import convert_batch, convert_sql, iter_path_list
+
+
+@pytest.mark.parametrize('sql, expected', [
+    # The alias comes out of the parser, after the trigger index was built
+    ("SELECT 'My Alias' = a FROM t", "SELECT a AS `My Alias` FROM t"),
+    ("SELECT [My Alias] = a FROM t", "SELECT a AS `My Alias` FROM t"),
+    ("SELECT a = ISNULL(b, 0) + c FROM t WITH (NOLOCK)", "SELECT COALESCE(b, 0) || c AS a FROM t"),
+    # CONVERT with a style is left for review, type included
+    ("SELECT a = CONVERT(VARCHAR(10), b, 120) FROM t", "SELECT CONVERT(VARCHAR(10), b, 120) AS a FROM t"),
+    ("SELECT CONVERT(NVARCHAR(MAX), CONVERT(VARCHAR(5), b), 1) FROM t",
+     "SELECT CONVERT(NVARCHAR(MAX), cast(b as string), 1) FROM t"),
+])
+def test_convert_sql(sql, expected):
+    assert convert_sql(sql).sql.strip() == expected
+
+
+def test_convert_batch_counts_unreadable_files_as_failed(tmp_path):
+    (tmp_path / 'bad.sql').write_bytes(b'\xff\xfe bad')
+    (tmp_path / 'ok.sql').write_text('SELECT a = 1 FROM t')
+    paths = b'\0'.join(os.fsencode(tmp_path / name) for name in ('bad.sql', 'ok.sql', 'missing.sql'))
+    output_dir = tmp_path / 'out'
+    assert convert_batch(iter_path_list(io.BytesIO(paths)), str(output_dir)) == 1
+    assert 'AS a' in (output_dir / str(tmp_path / 'ok.sql').lstrip(os.sep)).read_text()
+
+
+def test_convert_batch_keeps_tar_members_inside_the_archive():
+    sources = [('../sample.sql', 'SELECT a = 1 FROM t'), ('/abs/./ok.sql', 'SELECT b = 1 FROM t')]
+    output = io.BytesIO()
+    assert convert_batch(sources, output=output) == 1
+    output.seek(0)
+    with tarfile.open(fileobj=output) as archive:
+        assert archive.getnames() == ['abs/ok.sql']
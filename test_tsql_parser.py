@@ -0,0 +1,64 @@
+import pytest
+from tsql_parser import rewrite_convert_calls, rewrite_select_aliases
+
+
+def select_aliases(sql):
+    return rewrite_select_aliases(sql)[0]
+
+
+def convert_calls(sql):
+    return rewrite_convert_calls(sql)[0]
+
+
+@pytest.mark.parametrize('sql, expected', [
+    ("SELECT a = b, c = ISNULL(d, 0) FROM t", "SELECT b AS a, ISNULL(d, 0) AS c FROM t"),
+    ("SELECT DISTINCT TOP (5) a = b FROM t", "SELECT DISTINCT TOP (5) b AS a FROM t"),
+    ("SELECT 'My Alias' = a, 'it''s `x`' = b FROM t", "SELECT a AS `My Alias`, b AS `it's ``x``` FROM t"),
+    ("SELECT [x] = (SELECT y = 1) FROM t", "SELECT (SELECT 1 AS y) AS [x] FROM t"),
+    ("SELECT a = CASE WHEN b = 1 THEN 'x' ELSE 'y' END FROM t",
+     "SELECT CASE WHEN b = 1 THEN 'x' ELSE 'y' END AS a FROM t"),
+    # Comparisons and variable assignments are not aliases
+    ("SELECT a FROM t WHERE b = 1", "SELECT a FROM t WHERE b = 1"),
+    ("SELECT @total = SUM(x) FROM t", "SELECT @total = SUM(x) FROM t"),
+])
+def test_select_aliases(sql, expected):
+    assert select_aliases(sql) == expected
+
+
+# TSQL statements need no ; so a SELECT list ends at the next statement
+@pytest.mark.parametrize('sql, expected', [
+    ("IF @x = 1 BEGIN SELECT a = 2 END ELSE SELECT z = 3 RETURN",
+     "IF @x = 1 BEGIN SELECT 2 AS a END ELSE SELECT 3 AS z RETURN"),
+    ("SELECT a = b\nEXEC dbo.proc", "SELECT b AS a\nEXEC dbo.proc"),
+    ("SELECT a = b\nEXECUTE dbo.proc", "SELECT b AS a\nEXECUTE dbo.proc"),
+    ("SELECT a = 1\nPRINT 'done'", "SELECT 1 AS a\nPRINT 'done'"),
+    ("SELECT a = 1\nDECLARE @y INT", "SELECT 1 AS a\nDECLARE @y INT"),
+    ("SELECT a = 1\nSET @y = 2", "SELECT 1 AS a\nSET @y = 2"),
+    ("WHILE @i < 3 BEGIN SELECT a = @i SET @i = @i + 1 END",
+     "WHILE @i < 3 BEGIN SELECT @i AS a SET @i = @i + 1 END"),
+    ("BEGIN SELECT a = CASE WHEN b = 1 THEN 1 ELSE CASE WHEN c = 1 THEN 2 END END, d = 3 END",
+     "BEGIN SELECT CASE WHEN b = 1 THEN 1 ELSE CASE WHEN c = 1 THEN 2 END END AS a, 3 AS d END"),
+])
+def test_select_list_ends_at_next_statement(sql, expected):
+    assert select_aliases(sql) == expected
+
+
+def test_select_aliases_unchanged_returns_input():
+    sql = "SELECT a FROM t WHERE b = 1"
+    assert rewrite_select_aliases(sql) == (sql, 0, 0)
+
+
+@pytest.mark.parametrize('sql, expected', [
+    ("CONVERT(VARCHAR(10), a)", "cast(a as string)"),
+    ("CONVERT(NVARCHAR, a)", "CAST(a AS STRING)"),
+    ("CONVERT(DATETIME2, a)", "cast(a as timestamp)"),
+    ("CONVERT(BIT, a)", "CAST(a AS BOOLEAN)"),
+    ("CONVERT(INT, CONVERT(VARCHAR(10), a))", "CAST(cast(a as string) AS INT)"),
+    ("CONVERT(BINARY(32), HASHBYTES('SHA2_256', CONVERT(NVARCHAR(100), a)))",
+     "CAST(sha2(cast(a as string)) AS BINARY)"),
+    ("HASHBYTES('MD5', a)", "md5(a)"),
+    # Left for review, but nested calls are still rewritten
+    ("HASHBYTES('SHA3', CONVERT(INT, a))", "HASHBYTES('SHA3', CAST(a AS INT))"),
+])
+def test_convert_calls(sql, expected):
+    assert convert_calls(sql) == expected
@@ -0,0 +1,321 @@
+import functools
+import re
+from collections import namedtuple
+
+__all__ = [
+    'TokenRule',
+    'lex',
+    'apply_token_rules',
+    'lowercase_code',
+    'Segment',
+    'segment_jinja',
+    'mask_jinja',
+    'unmask_jinja',
+    'StatementSplitter',
+    'split_statements',
+    'iter_statements',
+    'iter_statement_ends',
+    'open_parens'
+]
+
+# Building blocks shared with scanners that only care about some token kinds
+JINJA = r"\{\{.*?(?:\}\}|\Z)|\{%.*?(?:%\}|\Z)|\{\#.*?(?:\#\}|\Z)"
+COMMENT = r"--[^\n]*|/\*.*?(?:\*/|\Z)"
+STRING = r"[Nn]?'(?:[^']|'')*(?:'|\Z)"
+QUOTED = r'"[^"\n]*"|\[[^\]\n]*\]'
+
+# Order matters: Jinja and comments must win over the punctuation they start with
+TOKEN_PATTERN = re.compile(rf"""
+     (?P<jinja>{JINJA})
+    |(?P<comment>{COMMENT})
+    |(?P<string>{STRING})
+    |(?P<quoted>{QUOTED})
+    |(?P<word>[A-Za-z_@\#][\w@\#$]*)
+    |(?P<number>(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)
+    |(?P<ws>\s+)
+    |(?P<punct>.)
+""", re.DOTALL | re.VERBOSE)
+
+
+def lex(sql):
+    """Lex TSQL/Jinja text into a flat list of (kind, text) tuples in a single pass
+
+    kind is one of: jinja, comment, string, quoted, word, number, ws, punct.
+    Joining the token texts always gives back the original string.
+    """
+    return [(m.lastgroup, m.group()) for m in TOKEN_PATTERN.finditer(sql)]
+
+
+WORD_CHARS = r'\w@\#$'
+
+
+class TokenRule:
+    """Rewrite a sequence of code tokens, e.g. ISNULL ( -> COALESCE(
+
+    sequence holds the token texts to match, case-insensitively. Whitespace
+    between them is allowed and dropped. Set strip_surrounding_ws to also
+    swallow the whitespace on both sides of the match (used for operators).
+    """
+
+    def __init__(self, name, sequence, replacement, strip_surrounding_ws=False):
+        self.name = name
+        self.sequence = tuple(s.upper() for s in sequence)
+        self.replacement = replacement
+        self.strip_surrounding_ws = strip_surrounding_ws
+        self.enabled = True
+        self.group = None
+
+    @property
+    def pattern(self):
+        """Regex source matching the sequence, see _token_rule_scanner"""
+        parts = []
+        for text in self.sequence:
+            parts.append(re.escape(text))
+            if re.match(rf'[{WORD_CHARS}]', text):
+                # Whole words only, ISNULL must not match ISNULLX
+                parts.append(rf'(?![{WORD_CHARS}])')
+        pattern = r'\s*'.join(parts)
+        if self.strip_surrounding_ws:
+            pattern = rf'\s*{pattern}\s*'
+        return pattern
+
+    def __repr__(self):
+        return f"TokenRule({self.name!r})"
+
+
+@functools.lru_cache(maxsize=32)
+def _token_rule_scanner(rules):
+    # Regions rules must not touch come first, so a rule can only match in
+    # code. Numbers are skipped too, the + in 1e+5 is not an operator.
+    alternatives = [rf"(?P<skip>{JINJA}|{COMMENT}|{STRING}|{QUOTED}|(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)"]
+    for index, rule in enumerate(rules):
+        alternatives.append(f"(?P<rule{index}>{rule.pattern})")
+    # Other words and whitespace are consumed whole. This keeps the scan from
+    # trying every rule at each character, and means a rule only ever starts
+    # at a word boundary (MYISNULL never matches ISNULL).
+    alternatives.append(rf"(?P<code>[{WORD_CHARS}]+|\s+)")
+    return re.compile('|'.join(alternatives), re.DOTALL | re.IGNORECASE)
+
+
+def apply_token_rules(sql, rules, counts=None):
+    """Apply all rules in one scan.
+
+    The rules and the lexer's string, comment, quoted identifier and Jinja
+    patterns are compiled into a single scanner. Those regions are copied
+    through untouched, rules only ever match in code.
+
+    Pass a dict as counts to receive [matches, bytes changed] per rule name.
+    """
+    rules = tuple(rules)
+    if not rules:
+        return sql
+
+    def replace(match):
+        if match.lastgroup in ('skip', 'code'):
+            return match.group()
+        rule = rules[int(match.lastgroup[4:])]
+        if counts is not None:
+            count = counts.setdefault(rule.name, [0, 0])
+            count[0] += 1
+            if rule.replacement != match.group():
+                count[1] += max(len(match.group()), len(rule.replacement))
+        return rule.replacement
+
+    return _token_rule_scanner(rules).sub(replace, sql)
+
+
+# String literals, comments and Jinja keep their case when lowercasing
+LOWERCASE_SKIP_PATTERN = re.compile(rf"{JINJA}|{COMMENT}|{STRING}", re.DOTALL)
+
+
+def lowercase_code(sql):
+    """Lowercase keywords and identifiers, leaving strings, comments and Jinja as they are"""
+    parts = []
+    position = 0
+    for match in LOWERCASE_SKIP_PATTERN.finditer(sql):
+        parts.append(sql[position:match.start()].lower())
+        parts.append(match.group())
+        position = match.end()
+    parts.append(sql[position:].lower())
+    return ''.join(parts)
+
+
+# kind is 'sql' or 'jinja', start and end are offsets into the segmented text
+Segment = namedtuple('Segment', ['kind', 'start', 'end'])
+
+JINJA_PATTERN = re.compile(JINJA, re.DOTALL)
+
+
+def segment_jinja(sql):
+    """Split text into alternating SQL and Jinja segments in one scan
+
+    Jinja is found the way lex finds it, {{ }}, {% %} and {# #} anywhere,
+    including inside string literals and comments, as dbt renders those too.
+    """
+    segments = []
+    position = 0
+    for match in JINJA_PATTERN.finditer(sql):
+        if match.start() > position:
+            segments.append(Segment('sql', position, match.start()))
+        segments.append(Segment('jinja', match.start(), match.end()))
+        position = match.end()
+    if position < len(sql):
+        segments.append(Segment('sql', position, len(sql)))
+    return segments
+
+
+# {{0}}, {%1%}, {#2#}: still Jinja of the same kind to the lexer and the rules,
+# but without any text a rule could match
+PLACEHOLDER_PATTERN = re.compile(r'\{([{%#])(\d+)[}%#]\}')
+
+
+def mask_jinja(sql):
+    """Replace every Jinja span with a numbered placeholder, returns (masked sql, spans)
+
+    Rules run on the masked text never see template code, and unmask_jinja
+    puts the spans back as they were, wherever the rules moved them.
+    """
+    spans = []
+    parts = []
+    for segment in segment_jinja(sql):
+        text = sql[segment.start:segment.end]
+        if segment.kind == 'sql':
+            parts.append(text)
+            continue
+        opening = text[1]
+        closing = '}' if opening == '{' else opening
+        parts.append(f'{{{opening}{len(spans)}{closing}}}')
+        spans.append(text)
+    if not spans:
+        return sql, spans
+    return ''.join(parts), spans
+
+
+def unmask_jinja(sql, spans):
+    if not spans:
+        return sql
+    return PLACEHOLDER_PATTERN.sub(lambda match: spans[int(match.group(2))], sql)
+
+
+# Statement terminators: ';' or a GO batch separator on its own line. Skipped
+# regions are matched first so terminators inside them are never seen.
+STATEMENT_BOUNDARY_PATTERN = re.compile(rf"""
+     (?P<skip>{JINJA}|{COMMENT}|{STRING}|{QUOTED})
+    |(?P<semicolon>;)
+    |(?P<go>^[ \t]*GO(?:[ \t]+\d+)?[ \t]*(?:\r?\n|\Z))
+""", re.DOTALL | re.MULTILINE | re.IGNORECASE | re.VERBOSE)
+
+# Jinja tags that open or close a block, statements are never split inside one
+JINJA_BLOCK_TAG = re.compile(r'\{%-?\s*(end)?(if|for|call|macro|filter|raw)\b')
+
+
+class StatementSplitter:
+    """Incrementally split TSQL/Jinja text into statements.
+
+    Feed text with feed(), which returns the statements completed so far, and
+    call finish() at the end for the remainder. Each statement keeps its
+    terminator, so joining all statements gives back the original text.
+    """
+
+    def __init__(self):
+        self.buffer = ''
+        # Offset in buffer up to which boundaries and Jinja blocks were already scanned
+        self.scanned = 0
+        self.depth = 0
+
+    def feed(self, text, final=False):
+        self.buffer += text
+        statements = []
+        start = 0
+        # Quoted identifiers, -- comments and GO are line based, so until the
+        # input is complete only whole lines are scanned
+        limit = len(self.buffer) if final else self.buffer.rfind('\n') + 1
+        scanned = max(limit, self.scanned)
+        for match in STATEMENT_BOUNDARY_PATTERN.finditer(self.buffer, self.scanned, scanned):
+            # A match touching the scan limit may continue in the next chunk
+            if not final and match.end() == limit:
+                scanned = match.start()
+                break
+            kind = match.lastgroup
+            if kind == 'skip':
+                tag = JINJA_BLOCK_TAG.match(match.group())
+                if tag:
+                    self.depth = max(0, self.depth + (-1 if tag.group(1) else 1))
+            elif self.depth == 0:
+                statements.append(self.buffer[start:match.end()])
+                start = match.end()
+        self.buffer = self.buffer[start:]
+        self.scanned = scanned - start
+        if final and self.buffer:
+            statements.append(self.buffer)
+            self.buffer = ''
+            self.scanned = 0
+        return statements
+
+    def finish(self):
+        return self.feed('', final=True)
+
+
+# The same scan on bytes, e.g. a memory-mapped UTF-8 file. Every delimiter is
+# ASCII and UTF-8 never uses ASCII bytes inside multibyte characters.
+STATEMENT_BOUNDARY_BYTES_PATTERN = re.compile(STATEMENT_BOUNDARY_PATTERN.pattern.encode('ascii'),
+                                              STATEMENT_BOUNDARY_PATTERN.flags & ~re.UNICODE)
+JINJA_BLOCK_TAG_BYTES = re.compile(JINJA_BLOCK_TAG.pattern.encode('ascii'))
+
+
+def iter_statement_ends(data):
+    """Yield the end offset of each statement in data, str or bytes-like (such as an mmap)
+
+    Boundaries are the ones StatementSplitter finds, but data is scanned in
+    place, so a mapped file is never decoded or copied. The last statement
+    ends at len(data), which is only yielded if text follows the last terminator.
+    """
+    if isinstance(data, str):
+        boundaries, block_tag = STATEMENT_BOUNDARY_PATTERN, JINJA_BLOCK_TAG
+    else:
+        boundaries, block_tag = STATEMENT_BOUNDARY_BYTES_PATTERN, JINJA_BLOCK_TAG_BYTES
+    depth = 0
+    end = 0
+    for match in boundaries.finditer(data):
+        if match.lastgroup == 'skip':
+            tag = block_tag.match(data, match.start(), match.end())
+            if tag:
+                depth = max(0, depth + (-1 if tag.group(1) else 1))
+        elif depth == 0:
+            end = match.end()
+            yield end
+    if end < len(data):
+        yield len(data)
+
+
+# Parentheses in code, skipped regions are matched first as for statements
+PAREN_PATTERN = re.compile(rf"(?:{JINJA}|{COMMENT}|{STRING}|{QUOTED})|(\()|(\))", re.DOTALL)
+
+
+def open_parens(sql):
+    """Number of ( in code still unclosed at the end of sql
+
+    Like the parsers' matching, a ) with nothing open is ignored. Text that
+    leaves none open can be converted on its own without changing how the
+    parentheses around it pair up.
+    """
+    depth = 0
+    for match in PAREN_PATTERN.finditer(sql):
+        if match.group(1):
+            depth += 1
+        elif match.group(2) and depth:
+            depth -= 1
+    return depth
+
+
+def split_statements(sql):
+    """Split a whole script into statements, see StatementSplitter"""
+    return StatementSplitter().feed(sql, final=True)
+
+
+def iter_statements(file, chunk_size=1024 * 1024):
+    """Yield statements from a text file object, reading it chunk by chunk"""
+    splitter = StatementSplitter()
+    for chunk in iter(lambda: file.read(chunk_size), ''):
+        yield from splitter.feed(chunk)
+    yield from splitter.finish()
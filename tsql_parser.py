@@ -0,0 +1,323 @@
+"""Recursive descent rewrites for constructs that need balanced parentheses:
+`alias = expression` items in SELECT lists, and CONVERT/HASHBYTES calls
+nested in each other.
+
+Each lexes the text with tsql_lexer.lex and walks the tokens once, so
+parentheses, commas and keywords inside strings, comments, quoted
+identifiers and Jinja never confuse them. Each rewrite returns (sql, rewrites, bytes changed),
+with sql returned as is when nothing was rewritten (see tsql_rules.ParserRule).
+"""
+from tsql_lexer import lex
+
+__all__ = [
+    'HASH_FUNCTIONS',
+    'rewrite_select_aliases',
+    'rewrite_convert_calls'
+]
+
+HASH_FUNCTIONS = {
+    'SHA2_256': 'sha2',
+    'SHA2_512': 'sha512',
+    'MD5': 'md5',
+    'SHA1': 'sha1'
+}
+
+# Words that end a SELECT list outside parentheses: the next clause, or the
+# next statement of a batch or procedure, which needs no ; in TSQL. All are
+# reserved words, so none can be a bare alias. END and ELSE only end it
+# outside a CASE expression, see _SelectListEnd.
+SELECT_LIST_END = frozenset([
+    'FROM', 'INTO', 'WHERE', 'GROUP', 'HAVING', 'ORDER', 'UNION', 'EXCEPT', 'INTERSECT',
+    'OPTION', 'FOR', 'SELECT', 'INSERT', 'UPDATE', 'DELETE', 'MERGE', 'WITH', 'GO',
+    'END', 'ELSE', 'BEGIN', 'IF', 'WHILE', 'EXEC', 'EXECUTE', 'PRINT', 'RETURN', 'DECLARE', 'SET',
+    'TRUNCATE', 'CREATE', 'ALTER', 'DROP', 'RAISERROR', 'THROW', 'COMMIT', 'ROLLBACK', 'BREAK',
+    'CONTINUE', 'GOTO', 'WAITFOR', 'USE', 'OPEN', 'FETCH', 'CLOSE', 'DEALLOCATE'
+])
+
+CHARACTER_TYPES = frozenset(['VARCHAR', 'NVARCHAR', 'CHAR', 'NCHAR'])
+TIMESTAMP_TYPES = frozenset(['DATETIME2', 'DATETIME', 'SMALLDATETIME'])
+
+
+def _is_trivia(token):
+    # Whitespace, comments and Jinja statements/comments, but not {{ expressions }}
+    kind, text = token
+    return kind in ('ws', 'comment') or (kind == 'jinja' and not text.startswith('{{'))
+
+
+def _is_jinja_tag(token):
+    return token[0] == 'jinja' and token[1].startswith('{%')
+
+
+def _match_parens(tokens):
+    """Map the index of every balanced ( to the index of its )"""
+    matches = {}
+    stack = []
+    for index, (kind, text) in enumerate(tokens):
+        if kind != 'punct':
+            continue
+        if text == '(':
+            stack.append(index)
+        elif text == ')' and stack:
+            matches[stack.pop()] = index
+    return matches
+
+
+class _Parser:
+    def __init__(self, sql):
+        self.tokens = lex(sql)
+        self.parens = _match_parens(self.tokens)
+        self.rewrites = 0
+        self.changed = 0
+
+    def text(self, start, end):
+        return ''.join(text for _, text in self.tokens[start:end])
+
+    def skip(self, index, end, trivia=_is_trivia):
+        while index < end and trivia(self.tokens[index]):
+            index += 1
+        return index
+
+    def skip_back(self, index, start):
+        while index > start and _is_trivia(self.tokens[index - 1]):
+            index -= 1
+        return index
+
+    def split(self, start, end, stop=None):
+        """Return (comma indexes, end index) of a comma separated list
+
+        Parenthesized groups are jumped over. The list ends at end, at an
+        unmatched ) or ;, or at the first token stop(token) is true for.
+        """
+        commas = []
+        index = start
+        while index < end:
+            kind, text = self.tokens[index]
+            if kind == 'punct':
+                if text == '(':
+                    # An unbalanced ( swallows the rest of the list
+                    index = self.parens.get(index, end - 1)
+                elif text == ',':
+                    commas.append(index)
+                elif text in ');':
+                    return commas, index
+            elif stop is not None and stop(self.tokens[index]):
+                return commas, index
+            index += 1
+        return commas, end
+
+    def result(self, sql, rewritten):
+        return (rewritten if self.rewrites else sql), self.rewrites, self.changed
+
+
+class _SelectAliasParser(_Parser):
+    def render(self, start, end):
+        """Text of tokens[start:end] with the items of every SELECT list in it rewritten"""
+        parts = []
+        index = start
+        while index < end:
+            kind, text = self.tokens[index]
+            parts.append(text)
+            index += 1
+            if kind == 'word' and text.upper() == 'SELECT':
+                index = self.select_list(index, end, parts)
+        return ''.join(parts)
+
+    def select_list(self, start, end, parts):
+        index = self.modifiers(start, end)
+        parts.append(self.text(start, index))
+        commas, list_end = self.split(index, end, _SelectListEnd())
+        for comma in commas + [list_end]:
+            parts.append(self.item(index, comma))
+            if comma < list_end:
+                parts.append(',')
+            index = comma + 1
+        return list_end
+
+    def modifiers(self, start, end):
+        """Index after DISTINCT/ALL and TOP (n) [PERCENT] [WITH TIES], which are kept as they are"""
+        index = start
+        while True:
+            word = self.skip(index, end)
+            if word >= end or self.tokens[word][0] != 'word':
+                return index
+            keyword = self.tokens[word][1].upper()
+            if keyword in ('DISTINCT', 'ALL', 'PERCENT'):
+                index = word + 1
+            elif keyword == 'TOP':
+                operand = self.skip(word + 1, end)
+                if operand < end and self.tokens[operand][1] == '(':
+                    operand = self.parens.get(operand, end - 1)
+                index = min(operand + 1, end)
+            elif keyword == 'WITH':
+                ties = self.skip(word + 1, end)
+                if ties >= end or self.tokens[ties][1].upper() != 'TIES':
+                    return index
+                index = ties + 1
+            else:
+                return index
+
+    def item(self, start, end):
+        """Rewrite one select item `alias = expression` to `expression AS alias`"""
+        alias = self.skip(start, end)
+        equals = self.skip(alias + 1, end, lambda token: token[0] == 'ws')
+        if equals >= end or self.tokens[equals] != ('punct', '=') or not _is_alias(self.tokens[alias]):
+            return self.render(start, end)
+        expression = self.skip(equals + 1, end, lambda token: token[0] == 'ws')
+        expression_end = self.skip_back(end, expression)
+        # Jinja blocks inside the expression ({% if %} a {% else %} b {% endif %})
+        # would end up around the alias, those are left to the cleanup rules
+        if expression >= expression_end or any(_is_jinja_tag(token) for token in self.tokens[expression:expression_end]):
+            return self.render(start, end)
+
+        kind, text = self.tokens[alias]
+        if kind == 'string':
+            # 'alias' = ... is a TSQL alias, not a string. Written as the Databricks
+            # identifier right away: the bracket transform only runs on SQL that had
+            # brackets to begin with (see tsql_rules.triggers_present)
+            text = '`' + text[text.index("'") + 1:-1].replace("''", "'").replace('`', '``') + '`'
+        original_length = len(self.text(alias, expression_end))
+        rewritten = f"{self.render(expression, expression_end)} AS {text}"
+        self.rewrites += 1
+        self.changed += max(original_length, len(rewritten))
+        return self.text(start, alias) + rewritten + self.render(expression_end, end)
+
+
+class _SelectListEnd:
+    """Stop condition for split over a SELECT list, tracking CASE ... END outside parentheses"""
+
+    def __init__(self):
+        self.case_depth = 0
+
+    def __call__(self, token):
+        if token[0] != 'word':
+            return False
+        word = token[1].upper()
+        if word == 'CASE':
+            self.case_depth += 1
+        elif word == 'END' and self.case_depth:
+            self.case_depth -= 1
+        elif word == 'ELSE' and self.case_depth:
+            pass
+        else:
+            return word in SELECT_LIST_END
+        return False
+
+
+def _is_alias(token):
+    kind, text = token
+    if kind == 'word':
+        # @variable = ... assigns a variable
+        return text[0] not in '@#'
+    return kind in ('quoted', 'string')
+
+
+def rewrite_select_aliases(sql):
+    """Rewrite `alias = expression` items of every SELECT list to `expression AS alias`
+
+    Only the = directly after the first identifier of an item counts, so
+    comparisons inside CASE, function calls and subqueries are left alone
+    and the alias always lands after the whole expression, however deeply
+    it nests.
+    """
+    if '=' not in sql:
+        return sql, 0, 0
+    parser = _SelectAliasParser(sql)
+    return parser.result(sql, parser.render(0, len(parser.tokens)))
+
+
+class _CallParser(_Parser):
+    def render(self, start, end):
+        """Text of tokens[start:end] with every CONVERT and HASHBYTES call in it rewritten"""
+        parts = []
+        index = start
+        while index < end:
+            kind, text = self.tokens[index]
+            if kind == 'word' and text.upper() in ('CONVERT', 'HASHBYTES'):
+                call = self.call(index, end)
+                if call is not None:
+                    text, index = call
+                    parts.append(text)
+                    continue
+            parts.append(text)
+            index += 1
+        return ''.join(parts)
+
+    def call(self, name, end):
+        """Return (rewritten text, index after the call), or None if this is not a rewritable call"""
+        open_paren = self.skip(name + 1, end)
+        close_paren = self.parens.get(open_paren)
+        if close_paren is None or close_paren >= end:
+            return None
+        commas, _ = self.split(open_paren + 1, close_paren)
+        bounds = list(zip([open_paren + 1] + [comma + 1 for comma in commas], commas + [close_paren]))
+        arguments = [self.render(start, stop).strip() for start, stop in bounds]
+
+        if self.tokens[name][1].upper() == 'HASHBYTES':
+            rewritten = self.hashbytes(arguments)
+        else:
+            rewritten = self.convert(bounds, arguments)
+        if rewritten is None:
+            # Keep the call, with whatever nested calls could be rewritten
+            rewritten = self.text(name, open_paren + 1) + self.render(open_paren + 1, close_paren) + ')'
+        else:
+            self.rewrites += 1
+            self.changed += max(len(self.text(name, close_paren + 1)), len(rewritten))
+        return rewritten, close_paren + 1
+
+    def is_call(self, bounds, function):
+        """Whether the tokens within bounds are exactly one call of function"""
+        start = self.skip(*bounds)
+        open_paren = self.skip(start + 1, bounds[1])
+        return (self.tokens[start][1].upper() == function and open_paren in self.parens
+                and self.skip(self.parens[open_paren] + 1, bounds[1]) == bounds[1])
+
+    def hashbytes(self, arguments):
+        if len(arguments) != 2 or not arguments[0].startswith("'"):
+            return None
+        function = HASH_FUNCTIONS.get(arguments[0].strip("'").strip().upper())
+        if function is None:
+            return None
+        return f"{function}({arguments[1]})"
+
+    def convert(self, bounds, arguments):
+        # CONVERT(type, expression, style) depends on the style, those are left for review
+        if len(arguments) != 2:
+            return None
+        type_start, type_end = bounds[0]
+        type_name = self.tokens[self.skip(type_start, type_end)]
+        if type_name[0] != 'word':
+            return None
+        name = type_name[1].upper()
+        data_type = arguments[0]
+        expression = arguments[1]
+        has_length = '(' in data_type
+
+        if name in CHARACTER_TYPES and (has_length or name == 'NVARCHAR'):
+            if not has_length:
+                return f"CAST({expression} AS STRING)"
+            return f"cast({expression} as string)"
+        if name in TIMESTAMP_TYPES:
+            return f"cast({expression} as timestamp)"
+        if name == 'BINARY' and has_length:
+            if expression.split('(', 1)[0] in HASH_FUNCTIONS.values() and self.is_call(bounds[1], 'HASHBYTES'):
+                # CONVERT(BINARY(32), HASHBYTES(...)) keeps the digest as is
+                return f"CAST({expression} AS BINARY)"
+            return f"cast({expression} as binary{data_type[len(type_name[1]):].strip()})"
+        if name == 'BIT':
+            return f"CAST({expression} AS BOOLEAN)"
+        return f"CAST({expression} AS {data_type})"
+
+
+def rewrite_convert_calls(sql):
+    """Rewrite CONVERT(type, expression) to CAST and HASHBYTES('algorithm', ...) to the Databricks hash function
+
+    Arguments are parsed to the matching parenthesis, so calls nest to any
+    depth and inner calls are rewritten first. Calls that can't be mapped
+    (CONVERT with a style argument, unknown hash algorithms) are left as they
+    are, apart from the calls nested in them.
+    """
+    lowered = sql.lower()
+    if 'convert' not in lowered and 'hashbytes' not in lowered:
+        return sql, 0, 0
+    parser = _CallParser(sql)
+    return parser.result(sql, parser.render(0, len(parser.tokens)))
@@ -0,0 +1,498 @@
+import contextlib
+import functools
+import hashlib
+import re
+import signal
+import threading
+import time
+from collections import Counter
+from tsql_lexer import TokenRule, apply_token_rules
+from tsql_parser import HASH_FUNCTIONS, rewrite_convert_calls, rewrite_select_aliases
+
+__all__ = [
+    'Rule',
+    'ParserRule',
+    'HASH_FUNCTIONS',
+    'list_rules',
+    'get_rule',
+    'enable_rule',
+    'disable_rule',
+    'enabled_rules',
+    'rules_disabled',
+    'apply_rule_group',
+    'apply_token_rule_group',
+    'run_transform',
+    'rule_triggers',
+    'all_triggers',
+    'find_triggers',
+    'triggers_present',
+    'ruleset_fingerprint',
+    'RuleTimeout',
+    'set_rule_time_budget',
+    'collect_skipped_rules',
+    'collect_applied_rules',
+    'collect_untriggered_rules',
+    'merge_rule_results',
+    'collect_rule_stats'
+]
+
+
+class Rule:
+    """A named regex rewrite, compiled once when the module is imported
+
+    triggers are lowercase substrings, at least one of which is in any SQL
+    the rule can change (see find_triggers). Without triggers the rule
+    always runs.
+    """
+
+    def __init__(self, name, pattern, replacement, flags=0, triggers=()):
+        self.name = name
+        self.pattern = re.compile(pattern, flags)
+        self.replacement = replacement
+        self.flags = flags
+        self.triggers = tuple(triggers)
+        self.enabled = True
+        self.group = None
+
+    def apply(self, sql):
+        return self.pattern.sub(self.replacement, sql)
+
+    def apply_counted(self, sql):
+        """Like apply, but returns (result, matches, bytes changed)"""
+        matches = 0
+        changed = 0
+
+        def replace(match):
+            nonlocal matches, changed
+            if callable(self.replacement):
+                text = self.replacement(match)
+            else:
+                text = match.expand(self.replacement)
+            matches += 1
+            if text != match.group():
+                changed += max(len(match.group()), len(text))
+            return text
+
+        return self.pattern.sub(replace, sql), matches, changed
+
+    def __repr__(self):
+        return f"Rule({self.name!r}, group={self.group!r}, enabled={self.enabled})"
+
+
+class ParserRule:
+    """A named rewrite done by a tsql_parser function, for constructs a regex can't balance
+
+    function(sql) returns (result, rewrites, bytes changed), with sql itself
+    as the result when nothing was rewritten. triggers as for Rule.
+    """
+
+    def __init__(self, name, function, triggers=()):
+        self.name = name
+        self.function = function
+        self.triggers = tuple(triggers)
+        self.enabled = True
+        self.group = None
+
+    def apply(self, sql):
+        return self.function(sql)[0]
+
+    def apply_counted(self, sql):
+        return self.function(sql)
+
+    def __repr__(self):
+        return f"ParserRule({self.name!r}, group={self.group!r}, enabled={self.enabled})"
+
+
+# name -> rule, in the order the rules are applied
+_REGISTRY = {}
+
+
+def _register(group, rules):
+    for rule in rules:
+        if rule.name in _REGISTRY:
+            raise ValueError(f"Duplicate rule name: {rule.name}")
+        rule.group = group
+        _REGISTRY[rule.name] = rule
+
+
+def list_rules(group=None):
+    """Return all registered rules in application order, optionally for one group"""
+    return [rule for rule in _REGISTRY.values() if group is None or rule.group == group]
+
+
+def get_rule(name):
+    try:
+        return _REGISTRY[name]
+    except KeyError:
+        raise KeyError(f"Unknown rule: {name}") from None
+
+
+def enable_rule(name):
+    get_rule(name).enabled = True
+
+
+def disable_rule(name):
+    get_rule(name).enabled = False
+
+
+def enabled_rules(group):
+    disabled = getattr(_state, 'disabled', ())
+    return [rule for rule in _REGISTRY.values()
+            if rule.group == group and rule.enabled and rule.name not in disabled]
+
+
+@contextlib.contextmanager
+def rules_disabled(names):
+    """Skip the named rules in this thread while the block runs, without touching the registry"""
+    names = frozenset(get_rule(name).name for name in names)
+    previous = getattr(_state, 'disabled', frozenset())
+    _state.disabled = previous | names
+    try:
+        yield
+    finally:
+        _state.disabled = previous
+
+
+class RuleTimeout(Exception):
+    """A rule ran past its time budget on the current input"""
+
+
+# Seconds a single rule may spend on one input before it is abandoned, None for no limit
+RULE_TIME_BUDGET = 10.0
+
+_state = threading.local()
+
+
+def set_rule_time_budget(seconds):
+    global RULE_TIME_BUDGET
+    RULE_TIME_BUDGET = seconds or None
+
+
+@contextlib.contextmanager
+def collect_skipped_rules():
+    """Collect the names of rules skipped for exceeding their budget while the block runs"""
+    previous = getattr(_state, 'skipped', None)
+    _state.skipped = skipped = []
+    try:
+        yield skipped
+    finally:
+        _state.skipped = previous
+
+
+@contextlib.contextmanager
+def collect_applied_rules():
+    """Collect the names of rules that changed the SQL while the block runs, in first use order
+
+    Collectors nest, the rules an inner block collects are added to the outer one too.
+    """
+    previous = getattr(_state, 'applied', None)
+    _state.applied = applied = []
+    try:
+        yield applied
+    finally:
+        _state.applied = previous
+        if previous is not None:
+            previous.extend(name for name in applied if name not in previous)
+
+
+def _note_applied(name):
+    applied = getattr(_state, 'applied', None)
+    if applied is not None and name not in applied:
+        applied.append(name)
+
+
+@contextlib.contextmanager
+def collect_untriggered_rules():
+    """Count the rule runs skipped for lack of a trigger while the block runs, see triggers_present
+
+    Yields a Counter of rule name -> skipped runs. Collectors nest like collect_applied_rules.
+    """
+    previous = getattr(_state, 'untriggered', None)
+    _state.untriggered = untriggered = Counter()
+    try:
+        yield untriggered
+    finally:
+        _state.untriggered = previous
+        if previous is not None:
+            previous.update(untriggered)
+
+
+def _note_untriggered(name):
+    untriggered = getattr(_state, 'untriggered', None)
+    if untriggered is not None:
+        untriggered[name] += 1
+
+
+def merge_rule_results(applied=(), untriggered=None):
+    """Add rule results collected elsewhere, e.g. in a worker process, to this thread's collectors
+
+    applied is a list of rule names, untriggered a Counter as collect_untriggered_rules yields.
+    """
+    for name in applied:
+        _note_applied(name)
+    target = getattr(_state, 'untriggered', None)
+    if target is not None and untriggered:
+        target.update(untriggered)
+
+
+def rule_triggers(rule):
+    """The trigger substrings of a rule, empty if it always has to run
+
+    Token rules match whole sequences, so their longest word (or their
+    only token, e.g. +) is enough.
+    """
+    if isinstance(rule, TokenRule):
+        words = [text for text in rule.sequence if text[0].isalpha()] or rule.sequence
+        return (max(words, key=len).lower(),)
+    return rule.triggers
+
+
+@functools.lru_cache(maxsize=1)
+def all_triggers():
+    """Every trigger of every registered rule, enabled or not"""
+    return tuple(sorted({trigger for rule in _REGISTRY.values() for trigger in rule_triggers(rule)}))
+
+
+def find_triggers(sql, extra=()):
+    """The set of all_triggers() and extra triggers that occur in sql, case-insensitively
+
+    One lowercased copy and a substring search per trigger. A regex
+    alternation of the triggers would be a single pass, but re has no
+    multi-literal search and is tens of times slower here than str.find.
+    """
+    lowered = sql.lower()
+    return frozenset(trigger for trigger in all_triggers() + tuple(extra) if trigger in lowered)
+
+
+@contextlib.contextmanager
+def triggers_present(found):
+    """Only run the rules with a trigger in found (see find_triggers) in this thread while the block runs
+
+    The triggers of the input hold for the whole pipeline, so rules must
+    not introduce trigger text another rule would act on (a rule that
+    needs one done writes its output directly, as select_list_aliases
+    does with backticks for 'string' aliases).
+    """
+    previous = getattr(_state, 'triggers', None)
+    _state.triggers = found
+    try:
+        yield
+    finally:
+        _state.triggers = previous
+
+
+def _triggered(triggers):
+    found = getattr(_state, 'triggers', None)
+    return found is None or not triggers or not found.isdisjoint(triggers)
+
+
+def _triggered_rules(rules):
+    """The rules to run, noting the ones without a trigger in the input as untriggered"""
+    selected = []
+    for rule in rules:
+        if _triggered(rule_triggers(rule)):
+            selected.append(rule)
+        else:
+            _note_untriggered(rule.name)
+    return selected
+
+
+@contextlib.contextmanager
+def collect_rule_stats():
+    """Record wall time, matches and bytes changed per rule while the block runs
+
+    Yields {'transforms': {name: stats}, 'rules': {name: stats}}, where stats
+    holds group, seconds, matches and bytes_changed summed over every call.
+    Counting matches makes rules slower, so this is opt-in.
+    """
+    previous = getattr(_state, 'stats', None)
+    _state.stats = stats = {'transforms': {}, 'rules': {}}
+    try:
+        yield stats
+    finally:
+        _state.stats = previous
+
+
+def _record(kind, name, group, seconds, matches=0, changed=0):
+    stats = _state.stats[kind].setdefault(
+        name, {'group': group, 'seconds': 0.0, 'matches': 0, 'bytes_changed': 0})
+    stats['seconds'] += seconds
+    stats['matches'] += matches
+    stats['bytes_changed'] += changed
+
+
+def _profiling():
+    return getattr(_state, 'stats', None) is not None
+
+
+def run_transform(transform, sql, triggers=()):
+    """Call transform(sql), timing it if collect_rule_stats is active
+
+    A transform given triggers is skipped, like a rule, when none of them
+    is present (see triggers_present).
+    """
+    if not _triggered(triggers):
+        _note_untriggered(transform.__name__)
+        return sql
+    if not _profiling():
+        return transform(sql)
+    start = time.perf_counter()
+    result = transform(sql)
+    _record('transforms', transform.__name__, None, time.perf_counter() - start)
+    return result
+
+
+def _apply_rule(rule, sql):
+    if not _profiling():
+        result = rule.apply(sql)
+    else:
+        start = time.perf_counter()
+        result, matches, changed = rule.apply_counted(sql)
+        _record('rules', rule.name, rule.group, time.perf_counter() - start, matches, changed)
+    # sub returns its input as is when nothing matched, so this is usually free
+    if result is not sql and result != sql:
+        _note_applied(rule.name)
+    return result
+
+
+def apply_token_rule_group(sql, group):
+    """Apply the enabled token rules of one group in a single scan
+
+    When profiling, matches are counted per rule but the scan time can only
+    be measured for the whole group, see run_transform. The group is
+    skipped when no rule has a trigger in the input, otherwise every rule
+    runs, the scan costs the same.
+    """
+    rules = enabled_rules(group)
+    if not any(_triggered(rule_triggers(rule)) for rule in rules):
+        for rule in rules:
+            _note_untriggered(rule.name)
+        return sql
+    if not _profiling() and getattr(_state, 'applied', None) is None:
+        return apply_token_rules(sql, rules)
+    counts = {}
+    sql = apply_token_rules(sql, rules, counts)
+    for rule in rules:
+        matches, changed = counts.get(rule.name, (0, 0))
+        if _profiling():
+            _record('rules', rule.name, rule.group, 0.0, matches, changed)
+        if changed:
+            _note_applied(rule.name)
+    return sql
+
+
+def _raise_timeout(signum, frame):
+    raise RuleTimeout()
+
+
+def _can_interrupt():
+    # re checks for signals while matching, so a SIGALRM timer can stop a
+    # runaway pattern. Only available on Unix and in the main thread.
+    return (RULE_TIME_BUDGET is not None and hasattr(signal, 'setitimer')
+            and threading.current_thread() is threading.main_thread())
+
+
+def apply_rule_group(sql, group):
+    """Apply the enabled regex and parser rules of one group in order
+
+    Each rule runs under RULE_TIME_BUDGET. A rule that exceeds it leaves the
+    input unchanged, and its name goes to the active collect_skipped_rules
+    list. Rules without a trigger in the input are not run at all.
+    """
+    rules = _triggered_rules(enabled_rules(group))
+    if not _can_interrupt():
+        for rule in rules:
+            sql = _apply_rule(rule, sql)
+        return sql
+
+    previous_handler = signal.signal(signal.SIGALRM, _raise_timeout)
+    try:
+        for rule in rules:
+            try:
+                signal.setitimer(signal.ITIMER_REAL, RULE_TIME_BUDGET)
+                result = _apply_rule(rule, sql)
+                signal.setitimer(signal.ITIMER_REAL, 0)
+                sql = result
+            except RuleTimeout:
+                signal.setitimer(signal.ITIMER_REAL, 0)
+                skipped = getattr(_state, 'skipped', None)
+                if skipped is not None:
+                    skipped.append(rule.name)
+    finally:
+        signal.signal(signal.SIGALRM, previous_handler)
+    return sql
+
+
+# Keyword level rewrites, applied together in a single pass over the token
+# stream. Strings, comments and Jinja are never touched.
+_register('keyword_rules', [
+    TokenRule('concatenation', ['+'], ' || ', strip_surrounding_ws=True),
+    TokenRule('nolock_hint', ['WITH', '(', 'NOLOCK', ')'], ''),
+    TokenRule('isnull', ['ISNULL', '('], 'COALESCE('),
+    TokenRule('numeric', ['NUMERIC', '('], 'DECIMAL('),
+    TokenRule('tinyint', ['TINYINT'], 'int'),
+    TokenRule('getdate', ['GETDATE', '(', ')'], 'current_timestamp()'),
+    TokenRule('sysdatetime', ['SYSDATETIME', '(', ')'], 'current_timestamp()'),
+])
+
+_ALIAS_FLAGS = re.DOTALL | re.IGNORECASE
+
+# Parsed rather than matched, the alias has to land after the whole expression
+_register('convert_equal_alias_to_as', [
+    ParserRule('select_list_aliases', rewrite_select_aliases, triggers=['=']),
+])
+
+# CONVERT and HASHBYTES nest in each other, so both are rewritten in one parse
+_register('convert_cast', [
+    ParserRule('convert_calls', rewrite_convert_calls, triggers=['convert', 'hashbytes']),
+])
+
+_register('convert_data_types', [
+    # CAST(<number> AS BIT) literals
+    Rule('cast_bit',
+         r'cast\s*\(\s*(\d+)\s*as\s*bit\s*\)',
+         lambda m: f"cast({m.group(1)} as boolean)",
+         re.IGNORECASE, triggers=['bit']),
+
+    # Type declarations last (TINYINT -> INT is a keyword rule). CONVERT calls still here
+    # have a style argument and are left for review, their type stays as written
+    Rule('varchar_type', r'(\bconvert\s*\(\s*)?(?:n?varchar)\s*\(\s*(?:max|\d+)\s*\)',
+         lambda m: m.group() if m.group(1) else 'string', re.IGNORECASE, triggers=['varchar']),
+])
+
+_register('cleanup_unconverted_equals', [
+    # Handle table.column = alias pattern
+    Rule('cleanup_qualified_backticks', r',\s*(`[^`]+`\.`[^`]+`)\s*=\s*(`[^`]+`)', r',\1 AS \2', _ALIAS_FLAGS,
+         triggers=['=']),
+
+    # Handle remaining equals with backticks
+    Rule('cleanup_backticks', r',\s*(`[^`]+`)\s*=\s*(`[^`]+`)', r',\1 AS \2', _ALIAS_FLAGS, triggers=['=']),
+
+    # Handle any remaining equals between identifiers
+    Rule('cleanup_identifiers',
+         r',\s*([A-Za-z_][A-Za-z0-9_]*(?:\.[A-Za-z_][A-Za-z0-9_]*)?)\s*=\s*([A-Za-z_][A-Za-z0-9_]*)',
+         r',\1 AS \2', _ALIAS_FLAGS, triggers=['=']),
+
+    # Handle function calls with equals
+    Rule('cleanup_function_call',
+         r',\s*(UPPER|LOWER|TRIM|CAST|CONVERT|COALESCE|LEFT|RIGHT)\s*\([^)]+\)\s*=\s*([A-Za-z_][A-Za-z0-9_]*)',
+         r',\1 AS \2', _ALIAS_FLAGS, triggers=['=']),
+
+    # Handle reverse order (alias = expression)
+    Rule('cleanup_reverse_order',
+         r',\s*([A-Za-z_][A-Za-z0-9_]*)\s*=\s*([A-Za-z_][A-Za-z0-9_]*(?:\.[A-Za-z_][A-Za-z0-9_]*)?)',
+         r',\2 AS \1', _ALIAS_FLAGS, triggers=['=']),
+])
+
+def ruleset_fingerprint():
+    """Stable hash of the registered rules and which ones are enabled"""
+    digest = hashlib.sha256()
+    for rule in _REGISTRY.values():
+        if isinstance(rule, Rule):
+            definition = (rule.name, rule.pattern.pattern, rule.flags, rule.enabled)
+        elif isinstance(rule, ParserRule):
+            definition = (rule.name, rule.function.__module__, rule.function.__name__, rule.enabled)
+        else:
+            definition = (rule.name, rule.sequence, rule.replacement, rule.enabled)
+        digest.update(repr(definition).encode('utf-8'))
+    return digest.hexdigest()